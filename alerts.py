@@ -0,0 +1,164 @@
+# alerts.py
+import time
+from collections import Counter, deque
+import numpy as np
+
+from vision import PoseRules, PoseTracker, top_alert
+
+class AlertTracker:
+    """
+    Per-camera debouncer that turns noisy per-frame rule results into events.
+
+    Evidence is counted per tracked person: an alert opens once one person
+    shows it in `activate` of the last `window` analyzed frames and closes only
+    when everyone is down to `release` or fewer (hysteresis). The camera files
+    one event per alert type, however many people show it. After an event
+    closes, the same alert type stays quiet for `cooldown` seconds. Each event
+    is reported twice: once on "start", once on "end".
+    """
+    def __init__(self, window=8, activate=5, release=2, cooldown=60.0, max_gap=10.0):
+        if not 0 <= release < activate <= window:
+            raise ValueError("Need 0 <= release < activate <= window")
+        self.window = window
+        self.activate = activate
+        self.release = release
+        self.cooldown = cooldown
+        self.max_gap = max_gap      # Seconds without frames before open events are closed
+
+        self._frames = deque()      # (t, {(person, alert)}) of the last `window` analyzed frames
+        self._counts = Counter()    # (person, alert) -> frames in the window
+        self._open = {}             # alert -> start time
+        self._last_seen = {}        # alert -> time of its most recent frame
+        self._quiet_until = {}      # alert -> end of cooldown
+
+        self.frames = 0
+        self.alert_frames = 0
+        self.events = 0
+        self.suppressed = 0         # activations swallowed by the cooldown
+
+    def update(self, alerts, now=None, ids=None):
+        """
+        Feeds one analyzed frame's alert (None, one string, or one per person,
+        with their track `ids`) and returns the events it triggered: dicts with
+        type "start"/"end", alert, start and end (None while open).
+        """
+        now = time.time() if now is None else now
+        events = []
+
+        # A camera that went quiet (dropped stream) can't vouch for its open events
+        if self._frames and now - self._frames[-1][0] > self.max_gap:
+            events += self._close_all()
+
+        if alerts is None or isinstance(alerts, str):
+            present = frozenset([(None, alerts)] if alerts else [])
+        elif ids is None:
+            # Untracked people can't be told apart: two people choking is one frame of evidence
+            present = frozenset((None, a) for a in alerts if a)
+        else:
+            # Different people showing an alert in turns never add up to one event
+            present = frozenset((int(person), a) for person, a in zip(ids, alerts) if a)
+
+        self._frames.append((now, present))
+        self.frames += 1
+        for key in present:
+            self._counts[key] += 1
+            self._last_seen[key[1]] = now
+        if present:
+            self.alert_frames += 1
+        if len(self._frames) > self.window:
+            _, dropped = self._frames.popleft()
+            for key in dropped:
+                self._counts[key] -= 1
+                if not self._counts[key]:
+                    del self._counts[key]  # Tracks come and go; don't keep every id ever seen
+
+        for key, count in list(self._counts.items()):
+            name = key[1]
+            if name not in self._open and count >= self.activate:
+                if now < self._quiet_until.get(name, 0):
+                    self.suppressed += 1
+                    continue
+                # The event began with this person's earliest hit still in the window
+                start = next(t for t, hits in self._frames if key in hits)
+                self._open[name] = start
+                self.events += 1
+                events.append({"type": "start", "alert": name, "start": start, "end": None})
+
+        for name in list(self._open):
+            if all(count <= self.release for (_, other), count in self._counts.items() if other == name):
+                events.append(self._close(name))
+        return events
+
+    def _close(self, name):
+        start = self._open.pop(name)
+        end = self._last_seen.get(name, start)
+        self._quiet_until[name] = end + self.cooldown
+        return {"type": "end", "alert": name, "start": start, "end": end}
+
+    def _close_all(self):
+        events = [self._close(name) for name in list(self._open)]
+        self._frames.clear()
+        self._counts.clear()
+        return events
+
+    def flush(self):
+        """Closes every open event (e.g. when the camera shuts down)."""
+        return self._close_all()
+
+    def watching(self):
+        """
+        True while an alert is building up or open. Callers should then analyze
+        every frame: a patient lying still gives the motion gate nothing to
+        trigger on, and each skipped frame delays the Code Black.
+        """
+        return bool(self._open) or bool(self._counts)
+
+    def active(self):
+        """alert -> start time for the events currently open."""
+        return dict(self._open)
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "alert_frames": self.alert_frames,
+            "events": self.events,
+            "suppressed": self.suppressed,
+            "open": sorted(self._open),
+        }
+
+# --- REPLAY ---
+
+def save_recording(path, t, poses):
+    """
+    Stores a landmark sequence for replay: `t` is (T,) seconds, `poses` is
+    (T, 33, 2) normalized landmarks with NaN rows for frames without a person,
+    or (T, P, 33, 2) for up to P people (NaN for slots nobody fills).
+    """
+    np.savez_compressed(path, t=np.asarray(t, dtype=np.float64), poses=np.asarray(poses, dtype=np.float32))
+
+def load_recording(path):
+    data = np.load(path)
+    return data["t"], data["poses"]
+
+def replay(t, poses, tracker=None):
+    """
+    Runs a recorded sequence through the same rules + tracker as a live camera.
+    Returns (per-frame alerts, events). Multi-person recordings go through a
+    PoseTracker and report each frame's most urgent alert.
+    """
+    tracker = tracker or AlertTracker()
+    multi = np.ndim(poses) == 4
+    rules = PoseTracker() if multi else PoseRules()
+    alerts, events = [], []
+    for now, pose in zip(t, poses):
+        if multi:
+            ids, found = rules.classify(pose[~np.isnan(pose).any(axis=(1, 2))])
+            alert = top_alert(found)
+        else:
+            # Frames without a person leave the fall detector's state alone, as in app.py
+            ids, found = None, None if np.isnan(pose).any() else rules.classify(pose)
+            alert = found
+        alerts.append(alert)
+        events += tracker.update(found, now=float(now), ids=ids)
+    events += tracker.flush()
+    return alerts, events
@@ -1,164 +1,531 @@
 # app.py
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, Blueprint, current_app, render_template, request, jsonify, Response, send_from_directory, abort
 from flask_cors import CORS
-import cv2
+from werkzeug.local import LocalProxy
+import os
+import queue
 import threading
 import time
-import base64
+import json
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 # Import Modules
-from vision import VisionTriage 
-from services import TriageService, PatientManager
-
-app = Flask(__name__)
-CORS(app)
+from vision import draw_poses, MotionGate, FramePrep
+from inference import InferenceEngine
+from streaming import FrameBroadcaster
+from snapshots import SnapshotStore
+from capture import CameraCapture
+from alerts import AlertTracker
+from journal import PatientJournal
+from metrics import REGISTRY, histogram, gauge, sample_stacks
+from services import TriageService, PatientManager, TriageJobs
 
 # --- CONFIGURATION ---
+def parse_cam_sources(spec):
+    """"1=http://host:4747/video,2=ward.mp4" -> {1: ..., 2: ...}. Ids are optional; a bare number is a local device."""
+    sources = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        head, sep, tail = item.partition("=")
+        cam_id, source = (int(head), tail) if sep and head.isdigit() else (max(sources, default=0) + 1, item)
+        sources[cam_id] = int(source) if source.isdigit() else source
+    return sources
+
 CAM_SOURCES = {
     1: "http://10.115.10.189:4747/video",  # Camera 1
     2: "http://10.215.39.34:4747/video"   # Camera 2
 }
+if os.getenv("CAM_SOURCES"):
+    # Also takes video files, which play back in real time on a loop (benchmarks, demos)
+    CAM_SOURCES = parse_cam_sources(os.getenv("CAM_SOURCES"))
+
+# Reconnect backoff for dropped camera streams (exponential with jitter, capped)
+CAPTURE_BACKOFF_BASE = float(os.getenv("CAPTURE_BACKOFF_BASE", "0.5"))  # seconds
+CAPTURE_BACKOFF_MAX = float(os.getenv("CAPTURE_BACKOFF_MAX", "30"))  # seconds
+
+# Pose inference pool (0 = one worker per spare core)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "4"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "32"))
+MAX_POSES = int(os.getenv("MAX_POSES", "6"))  # people tracked per camera
+INFERENCE_WIDTH = int(os.getenv("INFERENCE_WIDTH", "384"))  # pose input width in px (0 = full frame)
+INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "2.0"))  # seconds a camera waits for a pose result
+
+# Adaptive mode: only run pose when the scene changes, plus a keep-alive
+MOTION_GATING = os.getenv("MOTION_GATING", "1") == "1"
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "4.0"))  # mean pixel diff, 0-255
+MOTION_KEEPALIVE = float(os.getenv("MOTION_KEEPALIVE", "2.0"))  # seconds
+
+# Code Black debouncing: an alert must hold for ALERT_ACTIVATE of the last ALERT_WINDOW
+# analyzed frames, ends at ALERT_RELEASE or fewer, then stays quiet for the cooldown
+ALERT_WINDOW = int(os.getenv("ALERT_WINDOW", "8"))
+ALERT_ACTIVATE = int(os.getenv("ALERT_ACTIVATE", "5"))
+ALERT_RELEASE = int(os.getenv("ALERT_RELEASE", "2"))
+ALERT_COOLDOWN = float(os.getenv("ALERT_COOLDOWN", "60"))  # seconds, per camera and alert type
+
+# Triage response cache (semantic matching is off unless a threshold is set)
+TRIAGE_CACHE_SIZE = int(os.getenv("TRIAGE_CACHE_SIZE", "512"))
+TRIAGE_CACHE_TTL = float(os.getenv("TRIAGE_CACHE_TTL", "900"))  # seconds
+TRIAGE_CACHE_SIMILARITY = float(os.getenv("TRIAGE_CACHE_SIMILARITY", "0"))  # e.g. 0.97
+
+# Chat model: "google" (Gemini) or "stub" (deterministic offline stand-in, STUB_LLM_LATENCY seconds per call)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "google")
+
+# Retrieval embeddings: "google" (API), "local" (offline ONNX) or "stub" (hashing, benchmarks only);
+# run `ingest.py --backend <name>` first
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "google")
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "./embedding_cache.sqlite")  # "" disables
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "10"))  # seconds per embedding API request (0 = none)
+RETRIEVER = os.getenv("RETRIEVER", "chroma")  # "numpy" = in-memory index loaded at startup
 
-# --- GLOBAL STATE ---
-patient_mgr = PatientManager()
-triage_service = TriageService()
+# Async triage: concurrent LLM calls and the per-call timeout
+TRIAGE_WORKERS = int(os.getenv("TRIAGE_WORKERS", "4"))
+TRIAGE_TIMEOUT = float(os.getenv("TRIAGE_TIMEOUT", "60"))  # seconds
+TRIAGE_JOB_TIMEOUT = float(os.getenv("TRIAGE_JOB_TIMEOUT", "90"))  # seconds for a whole job: retrieval + LLM
+TRIAGE_BATCH_CONCURRENCY = int(os.getenv("TRIAGE_BATCH_CONCURRENCY", "8"))  # LLM calls per batch
+TRIAGE_LLM_CONCURRENCY = int(os.getenv("TRIAGE_LLM_CONCURRENCY", "8"))  # LLM calls in flight overall
+TRIAGE_STREAMING = os.getenv("TRIAGE_STREAMING", "1") == "1"  # publish the ESI from the first tokens
+TRIAGE_WARMUP = os.getenv("TRIAGE_WARMUP", "1") == "1"  # load retrieval + LLM in the background at startup (0 = on first use)
 
-# Dictionary to hold state for each camera: { id: { 'frame': None, 'lock': Lock() } }
-STREAMS = {}
-for cam_id in CAM_SOURCES:
-    STREAMS[cam_id] = {
-        'frame': None,
-        'lock': threading.Lock()
-    }
+# Completed patients kept on the board before they're archived away
+QUEUE_HISTORY = int(os.getenv("QUEUE_HISTORY", "500"))
 
-def camera_worker(cam_id, url):
+# Durable queue: append-only journal + periodic snapshots, replayed on restart ("" disables)
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", "./journal")
+JOURNAL_SNAPSHOT_EVERY = int(os.getenv("JOURNAL_SNAPSHOT_EVERY", "5000"))  # events between compactions
+
+# Where Code Black snapshots are written (content-addressed, served from /snapshots/)
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "./snapshots")
+
+# Opt-in sampling profiler at /debug/profile (collapsed stacks of every thread)
+PROFILER = os.getenv("PROFILER", "0") == "1"
+
+
+# --- METRICS ---
+# Hot-path timers (a bisect + two increments each); everything else is read at scrape time
+INFERENCE_SECONDS = histogram("codeblue_inference_seconds", "Pose detection + rules per analyzed frame", labels=("camera",))
+FRAME_AGE_SECONDS = histogram("codeblue_frame_age_seconds", "Age of a frame when analysis picked it up", labels=("camera",))
+ENCODE_SECONDS = histogram("codeblue_encode_seconds", "JPEG encode per published frame", labels=("camera",))
+ALERT_LATENCY_SECONDS = histogram("codeblue_alert_latency_seconds",
+                                  "Capture of an alert's first evidence frame to its Code Black being filed")
+QUEUE_READ_SECONDS = histogram("codeblue_queue_read_seconds", "/api/queue handler latency",
+                               buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+
+# --- SERVER STATE ---
+
+class CodeBlue:
     """
-    Dedicated thread for a single camera.
-    Instantiates its own VisionTriage to avoid threading conflicts.
+    Everything one server owns: the patient queue, pose workers, triage service
+    and one pipeline per camera. Building it is cheap and starts nothing;
+    start() launches the camera threads and warms the triage pipeline in the
+    background, so the UI and queue are served while models load.
     """
-    print(f"[{cam_id}] Connecting to {url}...")
-    
-    # 1. Instantiate Vision Model (Thread-Local)
-    vision_system = VisionTriage()
-    cap = cv2.VideoCapture(url)
-    
-    # Reconnection / Loop logic
-    while True:
-        if not cap.isOpened():
-            cap.open(url)
-            time.sleep(2)
-            continue
-
-        success, frame = cap.read()
-        if not success:
-            # If stream drops, keep retrying
-            time.sleep(0.1)
-            continue
-
-        # 2. Run Vision Analysis
+    def __init__(self, inference_engine, journal=None):
+        self.inference_engine = inference_engine
+        self.journal = journal
+        self.patient_mgr = PatientManager(history_size=QUEUE_HISTORY, journal=journal)
+        self.snapshot_store = SnapshotStore(SNAPSHOT_DIR)
+
+        # Loads nothing until warm() or the first triage request
+        self.triage_service = TriageService(
+            cache_size=TRIAGE_CACHE_SIZE,
+            cache_ttl=TRIAGE_CACHE_TTL,
+            semantic_threshold=TRIAGE_CACHE_SIMILARITY or None,
+            llm_timeout=TRIAGE_TIMEOUT,
+            embedding_backend=EMBEDDING_BACKEND,
+            embedding_cache=EMBEDDING_CACHE,
+            embedding_timeout=EMBEDDING_TIMEOUT,
+            retriever_backend=RETRIEVER,
+            llm_backend=LLM_BACKEND,
+            llm_concurrency=TRIAGE_LLM_CONCURRENCY
+        )
+        self.triage_jobs = TriageJobs(self.triage_service, self.patient_mgr,
+                                      max_workers=TRIAGE_WORKERS, stream=TRIAGE_STREAMING,
+                                      timeout=TRIAGE_JOB_TIMEOUT or None)
+
+        # State for each camera: { id: { 'capture', 'broadcaster', 'gate', 'alerts' } }
+        self.streams = {}
+        for cam_id, url in CAM_SOURCES.items():
+            self.streams[cam_id] = {
+                'capture': CameraCapture(url, f"CAM {cam_id}", CAPTURE_BACKOFF_BASE, CAPTURE_BACKOFF_MAX),
+                'broadcaster': FrameBroadcaster(),
+                'gate': MotionGate(MOTION_THRESHOLD, MOTION_KEEPALIVE) if MOTION_GATING else None,
+                'alerts': AlertTracker(ALERT_WINDOW, ALERT_ACTIVATE, ALERT_RELEASE, ALERT_COOLDOWN)
+            }
+        self.started = None
+
+    def start(self):
+        self.started = time.time()
+
+        # Triage jobs live in memory: patients restored mid-triage need a fresh one
+        resumed = self.triage_jobs.resume(self.patient_mgr.get_active())
+        if resumed:
+            print(f"🔁 Re-queued triage for {resumed} restored patient(s)")
+
+        if TRIAGE_WARMUP:
+            threading.Thread(target=self._warm_triage, name="triage-warmup", daemon=True).start()
+
+        # Spin up a grabber and an analysis thread for each camera source
+        for cam_id, stream in self.streams.items():
+            stream['capture'].start()
+            threading.Thread(target=self.camera_worker, args=(cam_id,), name=f"camera-{cam_id}", daemon=True).start()
+        return self
+
+    def _warm_triage(self):
         try:
-            annotated_frame, alert = vision_system.analyze_frame(frame)
+            self.triage_service.warm()
+            print(f"🧠 Triage pipeline ready in {self.triage_service.warm_seconds:.1f}s")
         except Exception as e:
-            print(f"[{cam_id}] Vision Error: {e}")
-            annotated_frame = frame
-            alert = None
-
-        # 3. Handle "Code Black" Logic
-        if alert:
-            active_patients = patient_mgr.get_active()
-            last_complaint = active_patients[-1]['complaint'] if active_patients else ""
-            
-            # De-duplication: Ensure we don't spam the same alert
-            alert_msg = f"CODE BLACK (CAM {cam_id}): {alert}"
-            
-            if alert_msg not in last_complaint:
+            print(f"❌ Triage warm-up failed: {e}")
+
+    def readiness(self):
+        """Per-subsystem warm-up state. Cameras are reported but don't gate readiness (they come and go)."""
+        subsystems = {
+            "queue": {"ready": True, "state": "ready", "journal": self.journal is not None},
+            "triage": self.triage_service.status(),
+            "pose": self.inference_engine.status(),
+        }
+        cameras = {}
+        for cam_id, stream in self.streams.items():
+            staleness = stream['capture'].staleness()
+            cameras[cam_id] = {
+                "connected": stream['capture'].connected,
+                "staleness": round(staleness, 3) if staleness is not None else None,
+            }
+        return {
+            "ready": all(subsystem["ready"] for subsystem in subsystems.values()),
+            "uptime": round(time.time() - self.started, 3) if self.started else None,
+            "subsystems": subsystems,
+            "cameras": cameras,
+        }
+
+    def register_metrics(self):
+        """Scrape-time gauges, bound to this instance (replacing any earlier app's)."""
+        streams = self.streams
+        gauge("codeblue_capture_staleness_seconds", "Seconds since the newest frame was decoded",
+              lambda: {(c,): s['capture'].staleness() for c, s in streams.items()}, labels=("camera",))
+        gauge("codeblue_capture_decode_fps", "Frames decoded per second",
+              lambda: {(c,): s['capture'].decode_fps() for c, s in streams.items()}, labels=("camera",))
+        gauge("codeblue_capture_dropped_frames", "Frames replaced before they were analyzed",
+              lambda: {(c,): s['capture'].dropped for c, s in streams.items()}, labels=("camera",))
+        gauge("codeblue_viewers", "Connected MJPEG viewers",
+              lambda: {(c,): s['broadcaster'].viewers for c, s in streams.items()}, labels=("camera",))
+        gauge("codeblue_inference_queue_depth", "Frames waiting for a pose worker",
+              lambda: self.inference_engine.queue_depth())
+        gauge("codeblue_queue_patients", "Patients on the board",
+              lambda: {(k,): v for k, v in self.patient_mgr.counts().items()}, labels=("status",))
+        gauge("codeblue_queue_version", "Queue version (mutations so far)", lambda: self.patient_mgr.version)
+        gauge("codeblue_triage_jobs", "Async triage jobs",
+              lambda: {(k,): v for k, v in self.triage_jobs.stats().items() if k != "workers"}, labels=("status",))
+        gauge("codeblue_triage_cache_hit_rate", "Triage cache hit rate",
+              lambda: self.triage_service.cache.stats()["hit_rate"])
+        gauge("codeblue_ready", "1 once a subsystem is warm",
+              lambda: {(k,): int(v["ready"]) for k, v in self.readiness()["subsystems"].items()}, labels=("subsystem",))
+
+    def handle_alert_event(self, cam_id, event, frame, open_events):
+        """Files a Code Black when a camera event starts and stamps its end time when it ends."""
+        alert = event['alert']
+        alert_msg = f"CODE BLACK (CAM {cam_id}): {alert}"
+
+        if event['type'] == 'start':
+            if self.patient_mgr.is_open(alert_msg):
+                return  # Staff haven't completed the last one yet
+
+            # One snapshot per event; the record only carries URLs. A failed save (full disk,
+            # bad frame) must not take the camera down: the Code Black goes out without a picture
+            try:
+                digest = self.snapshot_store.save(frame)
+            except Exception as e:
+                digest = None
+                print(f"[{cam_id}] ⚠️ Snapshot not saved ({e.__class__.__name__}: {e}); filing without one")
+
+            # Check-and-insert is atomic, so a racing event can't double-file it
+            added = self.patient_mgr.add_patient_if_new(
+                alert_msg,
+                name=f"Room {cam_id} (Cam {cam_id})",
+                age="N/A",
+                complaint=alert_msg,
+                esi=0,
+                analysis=f"**VISUAL OVERRIDE:** Camera {cam_id} detected {alert}.",
+                source_docs=[],
+                snapshot=f"/snapshots/{digest}.jpg" if digest else None,
+                thumbnail=f"/snapshots/{digest}_thumb.jpg" if digest else None,
+                alert_start=time.strftime("%H:%M:%S", time.localtime(event['start'])),
+                alert_end=None
+            )
+            if added:
+                ALERT_LATENCY_SECONDS.observe(time.time() - event['start'])
+                open_events[alert] = added['id']
                 print(f"🚨 CAM {cam_id} DETECTED: {alert}")
-                
-                # Convert to base64 for snapshot
-                _, buffer = cv2.imencode('.jpg', annotated_frame)
-                b64_img = base64.b64encode(buffer).decode('utf-8')
-                
-                patient_mgr.add_patient(
-                    name=f"Room {cam_id} (Cam {cam_id})",
-                    age="N/A",
-                    complaint=alert_msg,
-                    esi=0, 
-                    analysis=f"**VISUAL OVERRIDE:** Camera {cam_id} detected {alert}.",
-                    source_docs=[],
-                    snapshot=f"data:image/jpeg;base64,{b64_img}"
-                )
-
-        # 4. Update Global State safely
-        with STREAMS[cam_id]['lock']:
-            STREAMS[cam_id]['frame'] = annotated_frame.copy()
-            
-        time.sleep(0.03) # Cap ~30 FPS per thread
-
-# --- START THREADS ---
-# Spin up a thread for each camera source
-for cam_id, url in CAM_SOURCES.items():
-    t = threading.Thread(target=camera_worker, args=(cam_id, url), daemon=True)
-    t.start()
+        else:
+            patient_id = open_events.pop(alert, None)
+            if patient_id:
+                self.patient_mgr.update_patient(patient_id, alert_end=time.strftime("%H:%M:%S", time.localtime(event['end'])))
+                print(f"✅ CAM {cam_id} CLEARED: {alert}")
+
+    def camera_worker(self, cam_id):
+        """
+        Dedicated analysis thread for a single camera.
+        Frames come from its CameraCapture (always the newest one, so a slow
+        frame never queues up the next); pose detection is handed off to the
+        shared InferenceEngine.
+        """
+        capture = self.streams[cam_id]['capture']
+        gate = self.streams[cam_id]['gate']
+        alert_tracker = self.streams[cam_id]['alerts']
+        broadcaster = self.streams[cam_id]['broadcaster']
+        inference_engine = self.inference_engine
+        prep = FramePrep(INFERENCE_WIDTH)  # Reused buffers: no per-frame full-size allocations
+        open_events = {}  # alert -> patient id filed for it
+        shown = ((), (), ())  # Last (poses, track ids, alerts), redrawn on frames we skip
+        last_seq = 0
+        last_timeout_log = float("-inf")
+
+        while True:
+            # 1. Wait for a frame we haven't seen (reconnects happen in the capture thread)
+            latest = capture.read(last_seq, timeout=1.0)
+            if latest is None:
+                continue
+            last_seq, frame, captured_at = latest
+            frame_age = time.monotonic() - captured_at
+            FRAME_AGE_SECONDS.observe(frame_age, cam_id)
+
+            # 2. Run Vision Analysis on a small mirrored view
+            # (the buffer is reused next frame; infer() only returns once a worker has it)
+            small = prep.inference_view(frame)
+            events = []
+            # Nothing is sent until a pose worker has its model loaded (frames would only pile up).
+            # While an alert is building up or open, every frame counts: bypass the motion gate
+            if inference_engine.serving and (gate is None or gate.should_infer(small, force=alert_tracker.watching())):
+                try:
+                    with INFERENCE_SECONDS.time(cam_id):
+                        shown = inference_engine.infer(cam_id, small, timeout=INFERENCE_TIMEOUT)
+                except queue.Full:
+                    # Scheduler is saturated; drop this frame rather than fall behind
+                    shown = ((), (), ())
+                except (TimeoutError, FutureTimeoutError):
+                    # Workers are behind; the frame is skipped if it's still queued when they get to it
+                    now = time.monotonic()
+                    if now - last_timeout_log > 10:
+                        print(f"[{cam_id}] ⚠️ Pose result took over {INFERENCE_TIMEOUT:g}s; dropping frames "
+                              f"(queue depth {inference_engine.queue_depth()})")
+                        last_timeout_log = now
+                    shown = ((), (), ())
+                except Exception as e:
+                    print(f"[{cam_id}] Vision Error: {e.__class__.__name__}: {e}")
+                    shown = ((), (), ())
+                else:
+                    # Only analyzed frames count towards an alert; skipped or dropped ones carry no evidence.
+                    # Stamped with capture time, so event starts (and alert latency) include queueing
+                    events = alert_tracker.update(shown[2], now=time.time() - frame_age, ids=shown[1])
+
+            # Nobody watching and nothing to snapshot: skip the full-size frame entirely
+            if not broadcaster.viewers and not events:
+                continue
+
+            # Flip frame for "mirror" effect (more natural interaction), into the reused buffer.
+            # Scene hasn't changed on skipped frames, so the last poses are still accurate.
+            annotated_frame = prep.display_view(frame)
+            draw_poses(annotated_frame, *shown)
+
+            # 3. Handle "Code Black" Logic (debounced into start/end events)
+            for event in events:
+                self.handle_alert_event(cam_id, event, annotated_frame, open_events)
+
+            # 4. Publish to viewers (encoded once, shared by every connection)
+            start = time.perf_counter()
+            if broadcaster.publish(annotated_frame):
+                ENCODE_SECONDS.observe(time.perf_counter() - start, cam_id)
+
+# The CodeBlue of the app handling the current request
+codeblue = LocalProxy(lambda: current_app.extensions["codeblue"])
+
+bp = Blueprint("codeblue", __name__)
+
+def create_app(start=True):
+    """
+    Builds the app. Serving starts in well under a second: the pose models load
+    inside their worker processes and the triage pipeline warms up on a
+    background thread (see /api/ready). With start=False nothing is launched
+    at all (no worker processes, threads or journal), for tests and tooling.
+    """
+    app = Flask(__name__)
+    CORS(app, expose_headers=["ETag", "X-Queue-Version"])
+
+    inference_engine = InferenceEngine(
+        num_workers=INFERENCE_WORKERS or None,
+        batch_size=INFERENCE_BATCH_SIZE,
+        max_queue=INFERENCE_QUEUE_SIZE,
+        num_poses=MAX_POSES
+    )
+    journal = None
+    if start:
+        # Fork the worker processes before anything else spins up threads or network clients
+        inference_engine.start()
+        if JOURNAL_DIR:
+            journal = PatientJournal(JOURNAL_DIR, snapshot_every=JOURNAL_SNAPSHOT_EVERY)
+
+    state = CodeBlue(inference_engine, journal)
+    if start:
+        state.start()
+    state.register_metrics()
+
+    app.extensions["codeblue"] = state
+    app.register_blueprint(bp)
+    return app
 
 # --- ROUTES ---
 
-@app.route('/')
+@bp.route('/')
 def index():
     """Renders the main single-page UI."""
     return render_template('index.html')
 
-@app.route('/video_feed/<int:cam_id>')
+@bp.route('/snapshots/<name>')
+def get_snapshot(name):
+    """Serves stored snapshots. Names are content hashes, so they can be cached forever."""
+    if not SnapshotStore.is_valid_name(name):
+        abort(404)
+    response = send_from_directory(codeblue.snapshot_store.root, name, max_age=31536000)
+    response.cache_control.immutable = True
+    return response
+
+@bp.route('/video_feed/<int:cam_id>')
 def video_feed(cam_id):
     """Streams the specific camera feed via MJPEG."""
-    if cam_id not in STREAMS:
+    if cam_id not in codeblue.streams:
         return "Camera not found", 404
 
-    def generate(c_id):
-        stream_data = STREAMS[c_id]
-        while True:
-            with stream_data['lock']:
-                if stream_data['frame'] is None:
-                    time.sleep(0.1)
-                    continue
-                
-                # Encode frame
-                (flag, encodedImage) = cv2.imencode(".jpg", stream_data['frame'])
-                if not flag:
-                    continue
-            
-            # Yield MJPEG chunk
-            yield(b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + 
-                  bytearray(encodedImage) + b'\r\n')
-            time.sleep(0.05)
-
-    return Response(generate(cam_id), mimetype="multipart/x-mixed-replace; boundary=frame")
+    return Response(codeblue.streams[cam_id]['broadcaster'].stream(),
+                    mimetype="multipart/x-mixed-replace; boundary=frame")
 
 # --- API ENDPOINTS ---
 
-@app.route('/api/submit', methods=['POST'])
+@bp.route('/api/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 200 once the queue, triage pipeline and pose workers are warm, 503 until then."""
+    report = codeblue.readiness()
+    return jsonify(report), 200 if report["ready"] else 503
+
+@bp.route('/api/submit', methods=['POST'])
 def submit_patient():
+    """Queues the patient right away; the ESI arrives later via /api/status/<job_id>."""
     data = request.json
-    esi, analysis, docs = triage_service.analyze(data['age'], data['complaint'])
-    
-    patient_mgr.add_patient(
-        name=data['name'],
-        age=data['age'],
-        complaint=data['complaint'],
-        esi=esi,
-        analysis=analysis,
-        source_docs=docs
-    )
-    return jsonify({"status": "success", "esi": esi})
+    job_id = codeblue.triage_jobs.submit(data['name'], data['age'], data['complaint'])
+    return jsonify({"status": "pending", "job_id": job_id, "esi": None}), 202
 
-@app.route('/api/queue', methods=['GET'])
+@bp.route('/api/submit_batch', methods=['POST'])
+def submit_batch():
+    """
+    Mass-casualty intake: { "patients": [{name, age, complaint}, ...] }.
+    Streams NDJSON: first the job ids (in request order), then one line per patient as it finishes.
+    """
+    patients = request.json.get('patients', [])
+    if not patients:
+        return jsonify({"error": "No patients"}), 400
+
+    job_ids, results = codeblue.triage_jobs.submit_batch(patients, max_concurrency=TRIAGE_BATCH_CONCURRENCY)
+
+    def generate():
+        yield json.dumps({"status": "pending", "job_ids": job_ids}) + "\n"
+        while (result := results.get()) is not None:
+            yield json.dumps(result) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+@bp.route('/api/status/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = codeblue.triage_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@bp.route('/api/queue', methods=['GET'])
 def get_queue():
-    return jsonify(patient_mgr.get_all())
+    """Full ordered queue. Supports If-None-Match, so unchanged polls cost a 304."""
+    with QUEUE_READ_SECONDS.time():
+        return _queue_response()
+
+def _queue_response():
+    version, listing = codeblue.patient_mgr.get_versioned()
+    etag = f"q{version}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(listing)
+    response.set_etag(etag)
+    response.headers['X-Queue-Version'] = str(version)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@bp.route('/api/queue/delta', methods=['GET'])
+def get_queue_delta():
+    """Only the records changed since ?since=<version> (plus ids that were archived away)."""
+    since = request.args.get('since', default=0, type=int)
+    return jsonify(codeblue.patient_mgr.changes_since(since))
 
-@app.route('/api/complete/<id>', methods=['POST'])
+@bp.route('/api/queue/stream')
+def queue_stream():
+    """Server-sent events: one delta per queue change, starting from ?since= or Last-Event-ID."""
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', default=0, type=int)
+    patient_mgr = codeblue.patient_mgr  # The generator outlives the request context
+
+    def generate(version):
+        while True:
+            delta = patient_mgr.changes_since(version)
+            if delta['full'] or delta['patients'] or delta['removed']:
+                version = delta['version']
+                yield f"id: {version}\ndata: {json.dumps(delta)}\n\n"
+
+            if not patient_mgr.wait_for_change(version, timeout=15):
+                yield ": keep-alive\n\n"
+
+    return Response(generate(since), mimetype="text/event-stream",
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/api/complete/<id>', methods=['POST'])
 def complete_patient(id):
-    success = patient_mgr.mark_done(id)
+    success = codeblue.patient_mgr.mark_done(id)
     return jsonify({"success": success})
 
+@bp.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Runtime stats for capacity planning (inference queue depth, throughput)."""
+    cameras = {}
+    for c_id, stream_data in codeblue.streams.items():
+        gate = stream_data['gate']
+        cameras[c_id] = gate.stats() if gate else {"motion_gating": False}
+        cameras[c_id]['alerts'] = stream_data['alerts'].stats()
+        cameras[c_id]['capture'] = stream_data['capture'].stats()
+        cameras[c_id].update(stream_data['broadcaster'].stats())
+    triage_service = codeblue.triage_service
+    return jsonify({
+        "inference": codeblue.inference_engine.stats(),
+        "cameras": cameras,
+        "triage_cache": triage_service.cache.stats(),
+        "embedding_cache": triage_service.embeddings.stats() if EMBEDDING_CACHE and triage_service.ready else None,
+        "triage_jobs": codeblue.triage_jobs.stats(),
+        "journal": codeblue.journal.stats() if codeblue.journal else None
+    })
+
+@bp.route('/metrics')
+def metrics():
+    """Prometheus text exposition of every histogram and gauge."""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+@bp.route('/debug/profile')
+def debug_profile():
+    """Samples all threads for ?seconds= (max 60) and returns collapsed stacks. Needs PROFILER=1."""
+    if not PROFILER:
+        abort(404)
+    seconds = min(request.args.get('seconds', default=5.0, type=float), 60.0)
+    interval = max(request.args.get('interval', default=0.005, type=float), 0.001)
+    return Response(sample_stacks(seconds, interval), mimetype="text/plain")
+
 if __name__ == '__main__':
+    # The debug reloader runs this file twice: a watcher that only restarts the server,
+    # and the serving child (WERKZEUG_RUN_MAIN=true). Only the child starts anything.
+    app = create_app(start=os.environ.get('WERKZEUG_RUN_MAIN') == 'true')
     # Threaded=True is important for Flask to handle multiple requests (video streams) at once
-    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
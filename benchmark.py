@@ -0,0 +1,926 @@
+# benchmark.py
+"""
+Microbenchmarks for the hot paths.
+
+    python benchmark.py vision --poses 20000
+    python benchmark.py queue --sizes 1000 10000 50000
+    python benchmark.py retriever --backend local
+    python benchmark.py stress --writers 8 --readers 4
+    python benchmark.py journal --patients 2000
+    python benchmark.py replay [--recording cam1.npz]
+    python benchmark.py tracker --people 1 5 20 50
+    python benchmark.py frames --width 1280 --height 720
+    python benchmark.py suite --cameras 1 2 4 8 [--video ward.mp4 ...]
+"""
+import argparse
+import errno
+import json
+import math
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+
+# --- HELPERS ---
+
+def _synthetic_poses(n, seed=0):
+    """Random but plausible upright poses with wandering wrists, as (n, 33, 2) float32."""
+    rng = np.random.default_rng(seed)
+    poses = rng.uniform(0.2, 0.8, size=(n, 33, 2)).astype(np.float32)
+    poses[:, 0] = (0.5, 0.2)                          # nose
+    poses[:, 11], poses[:, 12] = (0.6, 0.35), (0.4, 0.35)  # shoulders
+    poses[:, 23], poses[:, 24] = (0.55, 0.6), (0.45, 0.6)  # hips
+    poses[:, [0, 11, 12, 23, 24]] += rng.normal(0, 0.03, size=(n, 5, 2)).astype(np.float32)
+    poses[:, [15, 16]] = rng.uniform(0.25, 0.75, size=(n, 2, 2)).astype(np.float32)
+    return poses
+
+def _report(name, seconds, count, unit="pose"):
+    print(f"   {name:<32} {seconds * 1e3:9.2f} ms total   {seconds / count * 1e6:8.2f} us/{unit}")
+
+def _legacy_classify(landmarks, prev_nose_y, fall_velocity_threshold=0.05):
+    """The original scalar VisionTriage rule chain, kept here as the baseline."""
+    def dist(p1, p2):
+        return math.sqrt((p1.x - p2.x)**2 + (p1.y - p2.y)**2)
+
+    alert = None
+    l_shldr, r_shldr = landmarks[11], landmarks[12]
+    l_wrist, r_wrist = landmarks[15], landmarks[16]
+    nose = landmarks[0]
+    l_hip, r_hip = landmarks[23], landmarks[24]
+
+    shoulder_width = dist(l_shldr, r_shldr)
+    if shoulder_width < 0.01: shoulder_width = 0.01
+
+    neck_x = (l_shldr.x + r_shldr.x) / 2
+    neck_y = (l_shldr.y + r_shldr.y) / 2
+    chest_x = (l_shldr.x + r_shldr.x) / 2
+    chest_y = (l_shldr.y + r_shldr.y) / 2 + (0.3 * shoulder_width)
+
+    dist_l_neck = math.sqrt((l_wrist.x - neck_x)**2 + (l_wrist.y - neck_y)**2)
+    dist_r_neck = math.sqrt((r_wrist.x - neck_x)**2 + (r_wrist.y - neck_y)**2)
+    dist_l_chest = math.sqrt((l_wrist.x - chest_x)**2 + (l_wrist.y - chest_y)**2)
+    dist_r_chest = math.sqrt((r_wrist.x - chest_x)**2 + (r_wrist.y - chest_y)**2)
+    dist_l_head = dist(l_wrist, nose)
+    dist_r_head = dist(r_wrist, nose)
+
+    hip_mid_y = (l_hip.y + r_hip.y) / 2
+    sudden_fall = prev_nose_y is not None and nose.y - prev_nose_y > fall_velocity_threshold
+    is_down = nose.y > hip_mid_y
+
+    if dist_l_neck < (0.6 * shoulder_width) and dist_r_neck < (0.6 * shoulder_width):
+        alert = "CRITICAL: CHOKING DETECTED"
+    elif dist_l_chest < (0.35 * shoulder_width) or dist_r_chest < (0.45 * shoulder_width):
+        alert = "URGENT: CHEST PAIN"
+    elif is_down or sudden_fall:
+        alert = "CRITICAL: PATIENT DOWN"
+    elif (dist_l_head < (0.6 * shoulder_width) and l_wrist.y < l_shldr.y) or \
+         (dist_r_head < (0.6 * shoulder_width) and r_wrist.y < r_shldr.y):
+        alert = "MODERATE: HEADACHE"
+
+    return alert, nose.y
+
+# --- BENCHMARKS ---
+
+def bench_vision(args):
+    """Scalar rule chain vs. vectorized feature extraction + rule table."""
+    from vision import ALERTS, PoseRules, evaluate_rules, extract_features
+
+    poses = _synthetic_poses(args.poses, seed=args.seed)
+    objects = [[SimpleNamespace(x=float(x), y=float(y)) for x, y in pose] for pose in poses]
+    print(f"📐 Gesture rules over {len(poses)} poses")
+
+    # 1. Baseline: scalar math per frame
+    t0 = time.perf_counter()
+    prev, legacy = None, []
+    for landmarks in objects:
+        alert, prev = _legacy_classify(landmarks, prev)
+        legacy.append(alert)
+    _report("scalar (original)", time.perf_counter() - t0, len(poses))
+
+    # 2. Vectorized, still one frame per call (what a camera thread does)
+    rules = PoseRules()
+    t0 = time.perf_counter()
+    per_frame = [rules.classify(pose) for pose in poses]
+    _report("vectorized, per frame", time.perf_counter() - t0, len(poses))
+
+    # 3. Vectorized, whole sequence in one call
+    t0 = time.perf_counter()
+    prev_nose_y = np.concatenate([[np.nan], poses[:-1, 0, 1]]).astype(np.float32)
+    idx = evaluate_rules(extract_features(poses, prev_nose_y))
+    batched = [ALERTS[i] if i >= 0 else None for i in idx]
+    _report("vectorized, batched", time.perf_counter() - t0, len(poses))
+
+    # float32 vs float64 can only disagree on poses sitting exactly on a threshold
+    agree = sum(a == b for a, b in zip(legacy, batched)) / len(poses)
+    print(f"   agreement with original: {agree:.4%} (per-frame == batched: {per_frame == batched})")
+
+def bench_queue(args):
+    """PatientManager reads/writes as the board grows, vs. the old sort-per-request list."""
+    from services import PatientManager
+
+    print(f"📋 Patient queue ({args.reads} reads per size, history capped at {args.history})")
+    print(f"   {'patients':>9} {'add us':>8} {'done us':>8} {'read us':>9} {'read+write us':>14} {'sorted() us':>12}")
+    rng = np.random.default_rng(args.seed)
+
+    for n in args.sizes:
+        mgr = PatientManager(history_size=args.history)
+        esis = rng.integers(0, 6, size=n).tolist()
+
+        t0 = time.perf_counter()
+        ids = [mgr.add_patient(f"P{i}", 40, "synthetic", esi, "")["id"] for i, esi in enumerate(esis)]
+        add_s = (time.perf_counter() - t0) / n
+
+        done_ids = ids[::10]
+        t0 = time.perf_counter()
+        for patient_id in done_ids:
+            mgr.mark_done(patient_id)
+        done_s = (time.perf_counter() - t0) / len(done_ids)
+
+        # Dashboard polls with nothing new in between
+        t0 = time.perf_counter()
+        for _ in range(args.reads):
+            mgr.get_all()
+        read_s = (time.perf_counter() - t0) / args.reads
+
+        # Every poll preceded by a change (worst case)
+        active = [i for i in ids if mgr.get(i) and mgr.get(i)["status"] == "active"]
+        t0 = time.perf_counter()
+        for i in range(args.reads):
+            mgr.update_patient(active[i % len(active)], esi=int(esis[i % n]))
+            mgr.get_all()
+        churn_s = (time.perf_counter() - t0) / args.reads
+
+        # Baseline: what the list-based manager did on every poll
+        patients = list(mgr.get_all())
+        t0 = time.perf_counter()
+        for _ in range(args.reads):
+            sorted(patients, key=lambda x: (x['status'] == 'completed', x['esi']))
+        legacy_s = (time.perf_counter() - t0) / args.reads
+
+        print(f"   {n:>9} {add_s * 1e6:8.2f} {done_s * 1e6:8.2f} {read_s * 1e6:9.2f} "
+              f"{churn_s * 1e6:14.1f} {legacy_s * 1e6:12.1f}")
+
+def bench_stress(args):
+    """
+    Hammers one PatientManager from many threads and checks nothing was lost:
+    writers add/update/complete their own patients, alert threads race the same
+    dedup keys, readers validate every snapshot they get. Exits 1 on any violation.
+    """
+    from services import PatientManager, _esi_rank
+
+    mgr = PatientManager(history_size=args.writers * args.patients)
+    errors = []
+    read_times = []
+    stop = threading.Event()
+    barrier = threading.Barrier(args.writers + args.alerters + args.readers)
+    alert_keys = [f"CODE BLACK (CAM {i}): STRESS" for i in range(args.alert_keys)]
+    alerts_filed = []
+
+    def writer(w):
+        barrier.wait()
+        rng = np.random.default_rng(args.seed + w)
+        ids = [mgr.add_patient(f"W{w}-{i}", 40, "stress", None, "rev 0 esi None", triage="pending")["id"]
+               for i in range(args.patients)]
+        for rev in range(1, args.updates + 1):
+            for patient_id in ids:
+                esi = int(rng.integers(1, 6))
+                mgr.update_patient(patient_id, esi=esi, analysis=f"rev {rev} esi {esi}", rev=rev)
+        for patient_id in ids[::2]:
+            mgr.mark_done(patient_id)
+
+    def alerter(a):
+        barrier.wait()
+        for key in alert_keys:
+            record = mgr.add_patient_if_new(key, name=f"A{a}", age="N/A", complaint=key, esi=0, analysis="")
+            if record is not None:
+                alerts_filed.append(record["id"])
+
+    def reader():
+        barrier.wait()
+        last = -1
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            version, listing = mgr.get_versioned()
+            read_times.append(time.perf_counter() - t0)
+
+            if version < last:
+                errors.append(f"version went backwards: {last} -> {version}")
+            last = version
+            keys = [(p["status"] == "completed", _esi_rank(p), p["arrival"]) for p in listing]
+            if keys != sorted(keys):
+                errors.append(f"v{version}: listing out of order")
+            if len({p["id"] for p in listing}) != len(listing):
+                errors.append(f"v{version}: duplicate ids")
+            # Each update sets esi and analysis together; a torn record would disagree
+            consistent = [p for p in listing if not p["analysis"] or p["analysis"].endswith(f"esi {p['esi']}")]
+            if len(consistent) != len(listing):
+                errors.append(f"v{version}: {len(listing) - len(consistent)} torn record(s)")
+
+    threads = [threading.Thread(target=writer, args=(w,)) for w in range(args.writers)]
+    threads += [threading.Thread(target=alerter, args=(a,)) for a in range(args.alerters)]
+    readers = [threading.Thread(target=reader) for _ in range(args.readers)]
+
+    print(f"🧵 Stress: {args.writers} writers x {args.patients} patients x {args.updates} updates, "
+          f"{args.alerters} alert threads on {args.alert_keys} keys, {args.readers} readers")
+    t0 = time.perf_counter()
+    for t in threads + readers:
+        t.start()
+    for t in threads:
+        t.join()
+    stop.set()
+    for t in readers:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    # Every write must be accounted for
+    patients = args.writers * args.patients
+    completed = args.writers * ((args.patients + 1) // 2)
+    expected_version = patients * (1 + args.updates) + completed + args.alert_keys
+    listing = mgr.get_all()
+    writes = [p for p in listing if p["name"][0] == "W"]
+    if len(alerts_filed) != args.alert_keys:
+        errors.append(f"{len(alerts_filed)} alerts filed for {args.alert_keys} keys")
+    if mgr.version != expected_version:
+        errors.append(f"version {mgr.version}, expected {expected_version}")
+    if len(writes) != patients:
+        errors.append(f"{len(writes)} patients, expected {patients}")
+    if sum(p["status"] == "completed" for p in writes) != completed:
+        errors.append("completed count mismatch")
+    lost = [p["id"] for p in writes if p.get("rev") != args.updates]
+    if lost:
+        errors.append(f"{len(lost)} patient(s) lost their last update")
+
+    ops = expected_version + args.alerters * args.alert_keys
+    reads = np.array(read_times) * 1e6
+    print(f"   {ops} writes + {len(reads)} reads in {elapsed:.2f}s ({ops / elapsed:,.0f} writes/s)")
+    if len(reads):
+        print(f"   read latency: p50 {np.percentile(reads, 50):.1f} us, p99 {np.percentile(reads, 99):.1f} us")
+    if errors:
+        for e in errors[:20]:
+            print(f"   ❌ {e}")
+        sys.exit(1)
+    print(f"   ✅ no lost updates, torn records or duplicate alerts (final version {mgr.version})")
+
+def bench_journal(args):
+    """
+    Intake cost with the journal on vs. off, restart replay time for a whole shift,
+    then restores after a torn write, a failed fsync and a duplicated log tail.
+    """
+    from journal import PatientJournal
+    from services import PatientManager
+
+    def shift(mgr):
+        # Each patient: arrival, a few streamed analysis updates, the final result, discharge
+        rng = np.random.default_rng(args.seed)
+        ids = []
+        for i in range(args.patients):
+            ids.append(mgr.add_patient(f"P{i}", 40, "synthetic complaint", None, "", triage="pending")["id"])
+            for rev in range(args.updates):
+                mgr.update_patient(ids[-1], analysis="x" * 80 * (rev + 1), triage="streaming")
+            mgr.update_patient(ids[-1], esi=int(rng.integers(1, 6)), triage="done")
+            if i >= args.active:
+                mgr.mark_done(ids[i - args.active])
+        return args.patients * (args.updates + 2) + args.patients - args.active
+
+    root = tempfile.mkdtemp(prefix="journal-bench-")
+    try:
+        print(f"📒 Journal: {args.patients} patients x {args.updates + 2} updates, "
+              f"{args.active} left active, snapshot every {args.snapshot_every} events")
+        t0 = time.perf_counter()
+        events = shift(PatientManager(history_size=args.history))
+        _report("in-memory only", time.perf_counter() - t0, events, "event")
+
+        journal = PatientJournal(root, snapshot_every=args.snapshot_every, fsync=not args.no_fsync)
+        mgr = PatientManager(history_size=args.history, journal=journal)
+        t0 = time.perf_counter()
+        shift(mgr)
+        intake_s = time.perf_counter() - t0
+        journal.flush()
+        durable_s = time.perf_counter() - t0
+        _report("journaled (intake)", intake_s, events, "event")
+        _report("journaled (until durable)", durable_s, events, "event")
+        stats = journal.stats()
+        print(f"   {stats['commits']} fsyncs for {stats['events_written']} events "
+              f"(avg batch {stats['avg_batch']}), {stats['snapshots']} snapshot(s)")
+        expected = mgr.get_versioned()
+        journal.close()
+
+        t0 = time.perf_counter()
+        journal = PatientJournal(root, snapshot_every=args.snapshot_every)
+        restored = PatientManager(history_size=args.history, journal=journal)
+        replay_s = time.perf_counter() - t0
+        journal.close()
+        same = restored.get_versioned() == expected
+        print(f"   restart replay: {replay_s * 1e3:.1f} ms, state identical: {same}")
+        if not same:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    failed = [name for name, fault in (("partial write (ENOSPC)", "partial"),
+                                       ("write ok, fsync failed", "fsync"),
+                                       ("duplicated log tail", "duplicate"))
+              if not _journal_fault(name, fault)]
+    if failed:
+        sys.exit(1)
+
+class _FailingLog:
+    """Stands in for the journal's log file and fails one commit like a bad disk would."""
+    def __init__(self, f, fault):
+        self._f, self._fault = f, fault
+        # fsync on a character device fails (EINVAL), just like a disk that errors on flush
+        self._null = os.open(os.devnull, os.O_RDONLY) if fault == "fsync" else None
+
+    def write(self, data):
+        if self._fault == "partial":
+            self._fault = None
+            self._f.write(data[:len(data) // 2])
+            self._f.flush()
+            raise OSError(errno.ENOSPC, "No space left on device")
+        return self._f.write(data)
+
+    def fileno(self):
+        # The write went through; the fsync on this descriptor is what fails
+        if self._fault == "fsync":
+            self._fault = None
+            return self._null
+        return self._f.fileno()
+
+    def close(self):
+        if self._null is not None:
+            os.close(self._null)
+        self._f.close()
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+def _journal_fault(name, fault):
+    """Patients admitted around one failed commit must all come back exactly once."""
+    from journal import PatientJournal
+    from services import PatientManager
+
+    root = tempfile.mkdtemp(prefix="journal-fault-")
+    try:
+        journal = PatientJournal(root)
+        mgr = PatientManager(journal=journal)
+        mgr.add_patient("A", 40, "chest pain", 2, "")
+        journal.flush()
+        if fault == "duplicate":
+            # e.g. a crash between a failed fsync and its retry, from before commits rolled back
+            with open(journal.log_path, "rb") as f:
+                tail = f.readlines()[-1]
+            with open(journal.log_path, "ab") as f:
+                f.write(tail)
+        else:
+            journal._file = _FailingLog(journal._file, fault)  # Writer is idle after flush()
+        for patient in ("B", "C"):
+            mgr.add_patient(patient, 40, "fall", 3, "")
+        journal.flush(timeout=10)
+        expected = mgr.get_versioned()
+        errors = journal.stats()["errors"]
+        journal.close()
+
+        journal = PatientJournal(root)
+        restored = PatientManager(journal=journal)
+        journal.close()
+        names = [p["name"] for p in restored.get_versioned()[1]]
+        ok = restored.get_versioned() == expected and len(names) == len(set(names)) == len(restored)
+        print(f"   {'✅' if ok else '❌'} {name}: {errors} failed commit(s), restored {sorted(names)}")
+        return ok
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def _synthetic_scene(seconds, fps, noise, fall_at, fall_for, seed=0):
+    """
+    A patient standing still with hands down, plus single-frame gesture glitches
+    (probability `noise` per frame) and one real fall. Returns (t, poses).
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * fps)
+    t = np.arange(n) / fps
+    poses = _synthetic_poses(n, seed=seed)
+    poses[:, 0, 1] = 0.2 + rng.normal(0, 0.002, size=n)        # steady head
+    poses[:, [15, 16]] = ((0.65, 0.75), (0.35, 0.75))          # hands by the hips
+
+    glitch = rng.random(n) < noise
+    poses[glitch, 15] = poses[glitch, 11] * 0.5 + poses[glitch, 12] * 0.5  # hand jumps to the neck
+    poses[glitch, 16] = poses[glitch, 15]
+
+    down = (t >= fall_at) & (t < fall_at + fall_for)
+    poses[down, 0, 1] = 0.7                                    # head below the hips
+    poses[rng.random(n) < 0.05, :, :] = np.nan                 # frames with no detection
+    return t, poses
+
+def bench_replay(args):
+    """Per-frame alerts vs. the debounced AlertTracker on a recorded (or synthetic) landmark sequence."""
+    from alerts import AlertTracker, load_recording, replay, save_recording
+
+    if args.recording:
+        t, poses = load_recording(args.recording)
+        source = args.recording
+    else:
+        t, poses = _synthetic_scene(args.seconds, args.fps, args.noise, args.fall_at, args.fall_for, args.seed)
+        source = f"synthetic {args.seconds:.0f}s @ {args.fps} fps, {args.noise:.0%} glitch frames"
+        if args.save:
+            save_recording(args.save, t, poses)
+
+    tracker = AlertTracker(args.window, args.activate, args.release, args.cooldown)
+    t0 = time.perf_counter()
+    alerts, events = replay(t, poses, tracker)
+    elapsed = time.perf_counter() - t0
+
+    # What the old camera_worker filed: a new Code Black whenever the alert differed from the last one
+    legacy, last = 0, None
+    for alert in alerts:
+        if alert and alert != last:
+            legacy, last = legacy + 1, alert
+
+    print(f"🎞️ Replay: {len(t)} frames ({source})")
+    _report("rules + tracker", elapsed, len(t), "frame")
+    print(f"   alert frames: {sum(a is not None for a in alerts)}   "
+          f"filed per-frame: {legacy}   debounced events: {sum(e['type'] == 'start' for e in events)}")
+    for e in events:
+        if e["type"] == "end":
+            print(f"   {e['alert']:<28} {e['start']:8.2f}s -> {e['end']:8.2f}s")
+
+    # Two tracked people showing an alert in turns, neither for `activate` frames, is no event
+    split = AlertTracker(args.window, args.activate, args.release, args.cooldown)
+    turns = [1] * (args.activate - 1) + [2] * (args.activate - 1)
+    turns += [None] * max(0, args.window - len(turns))
+    found = sum((split.update(["CHEST PAIN"] if who else [], now=k / args.fps, ids=[who] if who else [])
+                 for k, who in enumerate(turns * 4)), [])
+    print(f"   split across two people: {sum(e['type'] == 'start' for e in found)} events (expected 0)")
+
+def _waiting_room(people, frames, seed=0):
+    """
+    `people` upright people drifting around a room, hands down, at different heights.
+    Returns (frames, people, 33, 2) poses and the true person index of each slot,
+    with the slot order shuffled every frame like a detector's output.
+    """
+    rng = np.random.default_rng(seed)
+    base = _synthetic_poses(people, seed=seed)
+    base[:, [15, 16]] = base[:, [23, 24]] + (0.0, 0.1)               # hands by the hips
+    base -= base[:, [11, 12, 23, 24]].mean(axis=1, keepdims=True)    # centre on the torso
+    base *= rng.uniform(0.3, 0.6, size=(people, 1, 1)).astype(np.float32)  # near/far people
+
+    # Torso centres spread over the room, then a slow random walk
+    start = rng.uniform(0.1, 0.9, size=(people, 2))
+    walk = np.cumsum(rng.normal(0, 0.002, size=(frames, people, 2)), axis=0)
+    centres = (start + walk).astype(np.float32)
+
+    poses = base[None] + centres[:, :, None, :]
+    order = np.argsort(rng.random((frames, people)), axis=1)
+    return np.take_along_axis(poses, order[:, :, None, None], axis=1), order
+
+def bench_tracker(args):
+    """PoseTracker cost per person as occupancy grows, and false falls vs. single-person PoseRules."""
+    from vision import ALERTS, PoseRules, PoseTracker
+
+    down = ALERTS.index("CRITICAL: PATIENT DOWN")
+    print(f"👥 Multi-person tracking over {args.frames} frames per occupancy")
+    print(f"   {'people':>7} {'us/frame':>9} {'us/person':>10} {'id switches':>12} "
+          f"{'false falls':>12} {'single-pose false falls':>24}")
+
+    for people in args.people:
+        poses, order = _waiting_room(people, args.frames, seed=args.seed)
+
+        tracker = PoseTracker()
+        t0 = time.perf_counter()
+        results = [tracker.update(frame) for frame in poses]
+        elapsed = time.perf_counter() - t0
+
+        # A stable tracker maps each true person to one id for the whole run
+        owners = {}
+        for (ids, _), truth in zip(results, order):
+            for track_id, person in zip(ids, truth):
+                owners.setdefault(int(person), set()).add(int(track_id))
+        switches = sum(len(v) - 1 for v in owners.values())
+        false_falls = sum(int((alerts == down).sum()) for _, alerts in results)
+
+        # Baseline: only ever look at whichever pose the detector listed first
+        rules = PoseRules()
+        single = sum(rules.classify(frame[0]) == ALERTS[down] for frame in poses)
+
+        print(f"   {people:>7} {elapsed / args.frames * 1e6:9.1f} {elapsed / args.frames / people * 1e6:10.2f} "
+              f"{switches:>12} {false_falls:>12} {single:>24}")
+
+def bench_frames(args):
+    """
+    Camera-thread cost per frame, up to the hand-off to the pose workers:
+    the old full-resolution path vs. FramePrep, with and without viewers.
+    Pickling stands in for the multiprocessing queue.
+    """
+    import cv2
+    from vision import FramePrep, MotionGate, draw_poses
+
+    rng = np.random.default_rng(args.seed)
+    frames = [rng.integers(0, 255, size=(args.height, args.width, 3), dtype=np.uint8) for _ in range(4)]
+    poses = _synthetic_poses(3, seed=args.seed)
+    shown = (poses, [0, 1, 2], [None, None, None])
+    encode_params = [cv2.IMWRITE_JPEG_QUALITY, 80]
+
+    def legacy(frame, gate):
+        annotated = cv2.flip(frame, 1)
+        if gate.should_infer(annotated):
+            pickle.dumps(annotated, protocol=pickle.HIGHEST_PROTOCOL)
+        draw_poses(annotated, *shown)
+        cv2.imencode(".jpg", annotated, encode_params)
+
+    def prepped(viewers):
+        prep = FramePrep(args.inference_width)
+        def run(frame, gate):
+            small = prep.inference_view(frame)
+            if gate.should_infer(small):
+                pickle.dumps(small, protocol=pickle.HIGHEST_PROTOCOL)
+            if viewers:
+                annotated = prep.display_view(frame)
+                draw_poses(annotated, *shown)
+                cv2.imencode(".jpg", annotated, encode_params)
+        return run
+
+    print(f"🖼️ Frame pipeline at {args.width}x{args.height}, inference width {args.inference_width}, "
+          f"{args.frames} frames")
+    print(f"   {'path':<28} {'ms/frame':>9} {'peak alloc KB/frame':>20}")
+    for name, step in (("full-res (original)", legacy),
+                       ("downscaled, 1 viewer", prepped(True)),
+                       ("downscaled, no viewers", prepped(False))):
+        # MotionGate threshold -1 forces inference on every frame, the worst case
+        gate = MotionGate(threshold=-1)
+        step(frames[0], gate)  # warm up buffers
+
+        t0 = time.perf_counter()
+        for i in range(args.frames):
+            step(frames[i % len(frames)], gate)
+        elapsed = time.perf_counter() - t0
+
+        tracemalloc.start()
+        peaks = []
+        for i in range(min(args.frames, 50)):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            step(frames[i % len(frames)], gate)
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        tracemalloc.stop()
+
+        print(f"   {name:<28} {elapsed / args.frames * 1e3:9.2f} {np.mean(peaks) / 1024:20.0f}")
+
+SAMPLE_COMPLAINTS = [
+    "chest pain radiating to left arm, sweating",
+    "twisted ankle playing football, can walk",
+    "shortness of breath and wheezing, history of asthma",
+    "fever and sore throat for three days",
+    "sudden severe headache, worst of my life",
+    "cut on finger from kitchen knife, bleeding controlled",
+    "abdominal pain right lower quadrant with vomiting",
+    "confused and slurred speech since this morning",
+]
+
+def bench_retriever(args):
+    """Chroma similarity search vs. the in-memory NumpyRetriever, on pre-embedded queries."""
+    from langchain_chroma import Chroma
+    from retrieval import COLLECTIONS, NumpyRetriever, embed_queries, get_embeddings
+
+    embeddings = get_embeddings(args.backend, args.cache)
+    vectorstore = Chroma(
+        persist_directory=args.db,
+        collection_name=COLLECTIONS[args.backend],
+        embedding_function=embeddings
+    )
+
+    t0 = time.perf_counter()
+    retriever = NumpyRetriever.from_chroma(vectorstore, embeddings, k=args.k)
+    load_s = time.perf_counter() - t0
+    print(f"🔎 Retrieval over {len(retriever.documents)} chunks "
+          f"({retriever.matrix.shape[1]} dims, index loaded in {load_s * 1e3:.1f} ms)")
+    if not retriever.documents:
+        print(f"❌ Collection is empty. Run: python ingest.py --backend {args.backend}")
+        return
+
+    queries = (SAMPLE_COMPLAINTS * (args.queries // len(SAMPLE_COMPLAINTS) + 1))[:args.queries]
+    vectors = embed_queries(embeddings, queries)  # Embedding cost is the same for both paths
+
+    t0 = time.perf_counter()
+    chroma_hits = [vectorstore.similarity_search_by_vector(v, k=args.k) for v in vectors]
+    _report("chroma, per query", time.perf_counter() - t0, len(queries), "query")
+
+    t0 = time.perf_counter()
+    numpy_hits = [retriever.search_by_vectors([v])[0] for v in vectors]
+    _report("numpy, per query", time.perf_counter() - t0, len(queries), "query")
+
+    t0 = time.perf_counter()
+    retriever.search_by_vectors(vectors)
+    _report("numpy, one batched matmul", time.perf_counter() - t0, len(queries), "query")
+
+    overlap = np.mean([
+        len({d.page_content for d in a} & {d.page_content for d in b}) / args.k
+        for a, b in zip(chroma_hits, numpy_hits)
+    ])
+    print(f"   top-{args.k} overlap with chroma: {overlap:.1%}")
+
+# --- END-TO-END SUITE ---
+
+SUITE_MARKER = "SUITE_RESULT "
+
+def _synthetic_video(path, seconds=10, fps=15, width=640, height=480, seed=0):
+    """A looping scene with a stick figure walking over sensor noise, so motion gating has work to do."""
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Can't write {path}")
+    for i in range(int(seconds * fps)):
+        frame = rng.integers(90, 110, size=(height, width, 3), dtype=np.uint8)
+        x = int(width * (0.2 + 0.6 * (0.5 - 0.5 * math.cos(2 * math.pi * i / (seconds * fps)))))
+        cv2.circle(frame, (x, height // 4), height // 16, (220, 200, 180), -1)
+        cv2.line(frame, (x, height // 4), (x, height * 2 // 3), (40, 40, 160), 12)
+        for dx in (-1, 1):
+            cv2.line(frame, (x, height * 2 // 3), (x + dx * width // 20, height - 20), (40, 40, 160), 10)
+            cv2.line(frame, (x, height // 3), (x + dx * width // 16, height // 2), (220, 200, 180), 8)
+        writer.write(frame)
+    writer.release()
+    return path
+
+def _cpu_seconds(pid):
+    """User + system CPU seconds of one process, from /proc."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+def _memory_kb(pid):
+    """Proportional set size (shared pages split between forked workers), or RSS without smaps_rollup."""
+    for path, key in ((f"/proc/{pid}/smaps_rollup", "Pss:"), (f"/proc/{pid}/status", "VmRSS:")):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(key):
+                        return int(line.split()[1])
+        except OSError:
+            continue
+    return 0
+
+def bench_suite(args):
+    """
+    End-to-end capacity run with no cameras and no API key: app.py replays video
+    files as N live cameras, with the stub LLM and embeddings behind the triage
+    path, while intake and dashboard clients hit /api/submit and /api/queue.
+    Every camera count runs in a fresh process so memory figures are comparable.
+    """
+    from vision import MODEL_PATH
+
+    if not os.path.exists(MODEL_PATH):
+        print(f"❌ {MODEL_PATH} not found; the pose workers need it.")
+        sys.exit(1)
+
+    workdir = tempfile.mkdtemp(prefix="codeblue-suite-")
+    try:
+        videos = [os.path.abspath(v) for v in args.video] or \
+                 [_synthetic_video(os.path.join(workdir, "synthetic.avi"), seed=args.seed)]
+        if not args.no_ingest:
+            from ingest import PDF_PATH, ingest
+            ingest([PDF_PATH], backend="stub")
+
+        print(f"🏥 Suite: {args.seconds:.0f}s per run after {args.warmup:.0f}s warm-up, "
+              f"{args.intake_rate:g} intake/s, {args.dashboards} dashboards, {os.cpu_count()} cores, "
+              f"motion gating {'on' if args.gating else 'off'}")
+        results = []
+        for cameras in args.cameras:
+            env = dict(
+                os.environ,
+                CAM_SOURCES=",".join(f"{i + 1}={videos[i % len(videos)]}" for i in range(cameras)),
+                LLM_BACKEND="stub",
+                EMBEDDING_BACKEND="stub",
+                EMBEDDING_CACHE="",
+                RETRIEVER="numpy",
+                STUB_LLM_LATENCY=str(args.llm_latency),
+                JOURNAL_DIR="",
+                SNAPSHOT_DIR=os.path.join(workdir, "snapshots"),
+                MOTION_GATING="1" if args.gating else "0",
+            )
+            command = [sys.executable, os.path.abspath(__file__), "suite-run",
+                       "--seconds", str(args.seconds), "--warmup", str(args.warmup),
+                       "--intake-rate", str(args.intake_rate), "--dashboards", str(args.dashboards),
+                       "--poll-interval", str(args.poll_interval), "--seed", str(args.seed)]
+            proc = subprocess.run(command, env=env, capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__)))
+            lines = [l for l in proc.stdout.splitlines() if l.startswith(SUITE_MARKER)]
+            if proc.returncode or not lines:
+                print(f"❌ {cameras} camera(s) failed (exit {proc.returncode}):")
+                print("\n".join((proc.stderr or proc.stdout).splitlines()[-15:]))
+                continue
+            results.append(json.loads(lines[-1][len(SUITE_MARKER):]))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if not results:
+        sys.exit(1)
+
+    def ms(value):
+        return f"{value * 1e3:8.1f}" if value is not None else f"{'-':>8}"
+
+    print(f"   {'cams':>4} {'frames/s':>9} {'per core':>9} {'cores':>6} {'alerts':>6} {'alert p50':>9} "
+          f"{'alert p99':>9} {'queue p50':>9} {'queue p99':>9} {'submit p99':>10} {'triaged':>7} {'MB':>7} {'MB/cam':>7}")
+    base = results[0]
+    for r in results:
+        # Memory per camera is the growth over the smallest run, so the fixed cost isn't smeared in
+        extra = r["cameras"] - base["cameras"]
+        per_camera = (r["memory_kb"] - base["memory_kb"]) / extra if extra else r["memory_kb"] / r["cameras"]
+        print(f"   {r['cameras']:>4} {r['frames_per_second']:9.1f} {r['frames_per_core_second']:9.1f} "
+              f"{r['cores_busy']:6.2f} {r['alerts']:>6} {ms(r['alert_latency_p50']):>9} {ms(r['alert_latency_p99']):>9} "
+              f"{ms(r['queue_p50']):>9} {ms(r['queue_p99']):>9} {ms(r['submit_p99']):>10} {r['triaged']:>7} "
+              f"{r['memory_kb'] / 1024:7.0f} {per_camera / 1024:7.1f}")
+    print("   (latencies in ms; alert latency runs from the first evidence frame's capture to the Code Black)")
+    print("   startup: " + ", ".join(f"{r['cameras']} cam(s) serving in {r['boot_seconds']:.2f}s, "
+                                   f"ready in {r['ready_seconds']:.1f}s" for r in results))
+
+def bench_suite_run(args):
+    """One suite run, inside the child process the suite configured through the environment."""
+    import app as server
+
+    t0 = time.perf_counter()
+    flask_app = server.create_app()
+    codeblue = flask_app.extensions["codeblue"]
+    streams = codeblue.streams
+    boot = time.perf_counter() - t0
+
+    # Warm-up: pose workers and the triage chain load, streams open, first analyses land
+    deadline = time.monotonic() + 120
+    while not codeblue.readiness()["ready"] and time.monotonic() < deadline:
+        time.sleep(0.1)
+    ready = time.perf_counter() - t0
+    time.sleep(args.warmup)
+
+    pids = [os.getpid()] + [p.pid for p in codeblue.inference_engine._workers]
+    cpu_start = sum(_cpu_seconds(pid) for pid in pids)
+    frames_start = sum(s['alerts'].frames for s in streams.values())
+    jobs_start = codeblue.triage_jobs.stats()["done"]
+    alerts_start = sum(s['alerts'].events for s in streams.values())
+    latency = server.ALERT_LATENCY_SECONDS  # Only runs that see alerts fill it
+
+    stop = threading.Event()
+    queue_times, submit_times = [], []
+
+    def dashboard():
+        client = flask_app.test_client()
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            client.get("/api/queue")  # No ETag: every poll pays for the full listing
+            queue_times.append(time.perf_counter() - t0)
+            stop.wait(args.poll_interval)
+
+    def intake():
+        client = flask_app.test_client()
+        rng = np.random.default_rng(args.seed)
+        interval = 1.0 / args.intake_rate
+        next_at = time.monotonic()
+        while not stop.is_set():
+            complaint = f"{SAMPLE_COMPLAINTS[int(rng.integers(len(SAMPLE_COMPLAINTS)))]} ({int(rng.integers(1e6))})"
+            t0 = time.perf_counter()
+            client.post("/api/submit", json={"name": "Bench", "age": int(rng.integers(1, 95)), "complaint": complaint})
+            submit_times.append(time.perf_counter() - t0)
+            next_at += interval
+            stop.wait(max(0.0, next_at - time.monotonic()))
+
+    threads = [threading.Thread(target=dashboard, daemon=True) for _ in range(args.dashboards)]
+    if args.intake_rate > 0:
+        threads.append(threading.Thread(target=intake, daemon=True))
+    t0 = time.monotonic()
+    for t in threads:
+        t.start()
+    stop.wait(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join(timeout=5)
+    elapsed = time.monotonic() - t0
+
+    cpu = sum(_cpu_seconds(pid) for pid in pids) - cpu_start
+    frames = sum(s['alerts'].frames for s in streams.values()) - frames_start
+    result = {
+        "cameras": len(streams),
+        "boot_seconds": boot,
+        "ready_seconds": ready,
+        "frames_per_second": frames / elapsed,
+        "frames_per_core_second": frames / cpu if cpu else 0.0,
+        "cores_busy": cpu / elapsed,
+        "alerts": sum(s['alerts'].events for s in streams.values()) - alerts_start,
+        "alert_latency_p50": latency.quantile(0.5),
+        "alert_latency_p99": latency.quantile(0.99),
+        "queue_p50": float(np.percentile(queue_times, 50)) if queue_times else None,
+        "queue_p99": float(np.percentile(queue_times, 99)) if queue_times else None,
+        "submit_p99": float(np.percentile(submit_times, 99)) if submit_times else None,
+        "triaged": codeblue.triage_jobs.stats()["done"] - jobs_start,
+        "memory_kb": sum(_memory_kb(pid) for pid in pids),
+    }
+    print(SUITE_MARKER + json.dumps(result), flush=True)
+    codeblue.inference_engine.stop()
+    os._exit(0)  # Capture and triage threads don't need an orderly shutdown
+
+def main():
+    parser = argparse.ArgumentParser(description="CodeBlue hot-path benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("vision", help="gesture rule evaluation")
+    p.add_argument("--poses", type=int, default=20000)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_vision)
+
+    p = sub.add_parser("queue", help="patient queue index")
+    p.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    p.add_argument("--reads", type=int, default=200)
+    p.add_argument("--history", type=int, default=500)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_queue)
+
+    p = sub.add_parser("retriever", help="handbook retrieval latency")
+    p.add_argument("--backend", choices=["google", "local", "stub"], default="local")
+    p.add_argument("--db", default="./chroma_db")
+    p.add_argument("--cache", default="./embedding_cache.sqlite")
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("-k", type=int, default=3)
+    p.set_defaults(func=bench_retriever)
+
+    p = sub.add_parser("stress", help="concurrent patient queue correctness")
+    p.add_argument("--writers", type=int, default=8)
+    p.add_argument("--patients", type=int, default=200)
+    p.add_argument("--updates", type=int, default=5)
+    p.add_argument("--alerters", type=int, default=4)
+    p.add_argument("--alert-keys", type=int, default=50)
+    p.add_argument("--readers", type=int, default=4)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_stress)
+
+    p = sub.add_parser("journal", help="durable queue journal and restart replay")
+    p.add_argument("--patients", type=int, default=2000)
+    p.add_argument("--updates", type=int, default=8, help="streamed analysis updates per patient")
+    p.add_argument("--active", type=int, default=50)
+    p.add_argument("--history", type=int, default=500)
+    p.add_argument("--snapshot-every", type=int, default=5000)
+    p.add_argument("--no-fsync", action="store_true")
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_journal)
+
+    p = sub.add_parser("replay", help="alert debouncing on landmark recordings")
+    p.add_argument("--recording", help=".npz with t (T,) and poses (T, 33, 2); synthetic if omitted")
+    p.add_argument("--save", help="write the synthetic scene to this .npz")
+    p.add_argument("--seconds", type=float, default=120)
+    p.add_argument("--fps", type=int, default=15)
+    p.add_argument("--noise", type=float, default=0.03)
+    p.add_argument("--fall-at", type=float, default=60)
+    p.add_argument("--fall-for", type=float, default=10)
+    p.add_argument("--window", type=int, default=8)
+    p.add_argument("--activate", type=int, default=5)
+    p.add_argument("--release", type=int, default=2)
+    p.add_argument("--cooldown", type=float, default=60)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_replay)
+
+    p = sub.add_parser("tracker", help="multi-person pose tracking")
+    p.add_argument("--people", type=int, nargs="+", default=[1, 5, 20, 50])
+    p.add_argument("--frames", type=int, default=1000)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_tracker)
+
+    p = sub.add_parser("frames", help="per-frame camera pipeline cost and allocations")
+    p.add_argument("--width", type=int, default=1280)
+    p.add_argument("--height", type=int, default=720)
+    p.add_argument("--inference-width", type=int, default=384)
+    p.add_argument("--frames", type=int, default=300)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_frames)
+
+    p = sub.add_parser("suite", help="end-to-end offline capacity run at N cameras")
+    p.add_argument("--cameras", type=int, nargs="+", default=[1, 2, 4])
+    p.add_argument("--video", nargs="*", default=[], help="recordings to replay (synthetic if omitted)")
+    p.add_argument("--seconds", type=float, default=30)
+    p.add_argument("--warmup", type=float, default=10)
+    p.add_argument("--intake-rate", type=float, default=2, help="patients submitted per second")
+    p.add_argument("--dashboards", type=int, default=4, help="clients polling /api/queue")
+    p.add_argument("--poll-interval", type=float, default=0.25)
+    p.add_argument("--llm-latency", type=float, default=0.5, help="stub LLM seconds per call")
+    p.add_argument("--gating", action="store_true", help="keep motion gating on (default: analyze every frame)")
+    p.add_argument("--no-ingest", action="store_true", help="skip indexing the handbook for the stub backend")
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_suite)
+
+    p = sub.add_parser("suite-run")  # internal: one suite run, in the child process
+    p.add_argument("--seconds", type=float, required=True)
+    p.add_argument("--warmup", type=float, required=True)
+    p.add_argument("--intake-rate", type=float, required=True)
+    p.add_argument("--dashboards", type=int, required=True)
+    p.add_argument("--poll-interval", type=float, required=True)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=bench_suite_run)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# capture.py
+import os
+import random
+import threading
+import time
+from collections import deque
+import cv2
+
+class CameraCapture:
+    """
+    Background frame grabber for one camera, latest-frame-wins.
+
+    A dedicated thread decodes the stream as fast as the source delivers and
+    keeps only the newest frame, so a slow consumer analyzes what the camera
+    sees now instead of draining OpenCV's buffer. Dropped connections are
+    retried with exponential backoff plus jitter.
+
+    A video file source plays back at its native frame rate and rewinds at the
+    end (with `loop`), so recordings stand in for live cameras in benchmarks.
+    """
+    def __init__(self, source, name="Camera", backoff_base=0.5, backoff_max=30.0, window=5.0, loop=True):
+        self.source = source
+        self.name = name
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+        self.loop = loop
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.window = window  # Seconds used for the decode FPS figure
+
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0               # Bumped for every decoded frame
+        self._captured_at = None    # monotonic time the current frame was decoded
+        self._consumed = 0          # Last seq handed to a reader
+        self._stopped = False
+        self._thread = None
+
+        self.connected = False
+        self.decoded = 0
+        self.dropped = 0            # Frames replaced before anyone read them
+        self.reconnects = 0
+        self.rewinds = 0
+        self.last_error = None
+        self.read_age = None        # How old the last frame handed out was, in seconds
+        self._decode_times = deque()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"capture-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def read(self, last_seq=0, timeout=1.0):
+        """
+        Waits for a frame newer than `last_seq`.
+        Returns (seq, frame, captured_at) or None on timeout. The frame must be
+        treated as read-only; it is shared with any other reader.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > last_seq or self._stopped, timeout):
+                return None
+            if self._frame is None or self._seq <= last_seq:
+                return None
+            self._consumed = self._seq
+            self.read_age = time.monotonic() - self._captured_at
+            return self._seq, self._frame, self._captured_at
+
+    def staleness(self):
+        """Seconds since the newest frame was decoded (None before the first one)."""
+        captured_at = self._captured_at
+        return None if captured_at is None else time.monotonic() - captured_at
+
+    def decode_fps(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._cond:
+            while self._decode_times and now - self._decode_times[0] > self.window:
+                self._decode_times.popleft()
+            return len(self._decode_times) / self.window
+
+    def stats(self):
+        staleness = self.staleness()
+        return {
+            "connected": self.connected,
+            "decode_fps": round(self.decode_fps(), 2),
+            "decoded": self.decoded,
+            "dropped": self.dropped,
+            "staleness": round(staleness, 3) if staleness is not None else None,
+            "read_age": round(self.read_age, 3) if self.read_age is not None else None,
+            "reconnects": self.reconnects,
+            "rewinds": self.rewinds,
+            "last_error": self.last_error,
+        }
+
+    def _run(self):
+        print(f"[{self.name}] Connecting to {self.source}...")
+        attempt = 0
+        while not self._stopped:
+            cap = cv2.VideoCapture(self.source)
+            # Keep OpenCV's own queue as short as the backend allows
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+            rewind = False
+            if cap.isOpened():
+                self.connected = True
+                self.last_error = None
+                if not self.rewinds:
+                    print(f"[{self.name}] Stream opened.")
+                # Files decode as fast as the CPU allows; pace them like the camera that recorded them
+                interval = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 30.0) if self.is_file else 0.0
+                next_at = time.monotonic()
+                while not self._stopped:
+                    success, frame = cap.read()
+                    if not success:
+                        rewind = self.is_file and self.loop and self.decoded > 0
+                        self.last_error = "end of file" if self.is_file else "read failed"
+                        break
+                    attempt = 0  # A frame arrived, so the link is healthy again
+                    self._publish(frame)
+                    if interval:
+                        # A slow decode pushes the schedule back instead of bursting to catch up
+                        next_at = max(next_at + interval, time.monotonic())
+                        time.sleep(max(0.0, next_at - time.monotonic()))
+            else:
+                self.last_error = "open failed"
+
+            cap.release()
+            self.connected = False
+            if self._stopped:
+                return
+            if rewind:
+                self.rewinds += 1
+                continue
+
+            # Exponential backoff with full jitter, so cameras on a flapping network don't sync up
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            # 2 ** 32 outgrows any sane cap; unbounded, it overflows a float after ~1024 tries
+            attempt = min(attempt + 1, 32)
+            self.reconnects += 1
+            print(f"[{self.name}] Signal lost ({self.last_error}). Reconnecting in {delay:.1f}s...")
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped, delay)
+
+    def _publish(self, frame):
+        now = time.monotonic()
+        with self._cond:
+            if self._seq > self._consumed:
+                self.dropped += 1
+            self._frame = frame
+            self._seq += 1
+            self._captured_at = now
+            self.decoded += 1
+            self._decode_times.append(now)
+            while now - self._decode_times[0] > self.window:
+                self._decode_times.popleft()
+            self._cond.notify_all()
@@ -0,0 +1,251 @@
+# inference.py
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from vision import VisionTriage, PoseTracker
+
+EXPIRED = "expired"  # Worker result for a frame whose deadline passed while it sat in the queue
+
+def _worker_main(jobs, results, batch_size, num_poses):
+    """
+    Runs inside a worker process.
+    Holds exactly one PoseLandmarker and drains the shared job queue in batches,
+    sending each batch of landmarks back in a single message.
+    """
+    try:
+        vision_system = VisionTriage(num_poses=num_poses)
+    except Exception as e:
+        results.put(("failed", f"{e.__class__.__name__}: {e}"))
+        return
+    results.put(("ready", None))  # Model loaded; counted for readiness
+    stopping = False
+
+    while not stopping:
+        job = jobs.get()
+        if job is None:
+            break
+
+        # Grab whatever else is already waiting, up to the batch size
+        batch = [job]
+        while len(batch) < batch_size:
+            try:
+                job = jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                stopping = True
+                break
+            batch.append(job)
+
+        out = []
+        for job_id, frame, expires in batch:
+            # Its camera already gave up on this frame (CLOCK_MONOTONIC is shared across processes)
+            if expires is not None and time.monotonic() > expires:
+                out.append((job_id, None, EXPIRED))
+                continue
+            try:
+                out.append((job_id, vision_system.detect_all(frame), None))
+            except Exception as e:
+                out.append((job_id, None, str(e)))
+        results.put(out)
+
+class InferenceEngine:
+    """
+    Central pose inference scheduler shared by all cameras.
+    Camera threads push frames into one bounded queue and a pool of worker
+    processes (one detector each) pulls them in batches, so throughput scales
+    with cores instead of with the number of cameras.
+    """
+    def __init__(self, num_workers=None, batch_size=4, max_queue=32, num_poses=1):
+        self.num_workers = num_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.num_poses = num_poses
+
+        # Fork so workers start without re-running the parent's imports
+        methods = multiprocessing.get_all_start_methods()
+        self._ctx = multiprocessing.get_context("fork" if "fork" in methods else None)
+        self._jobs = self._ctx.Queue(maxsize=max_queue)
+        self._results = self._ctx.Queue()
+        self._workers = []
+        self._collector = None
+
+        self._lock = threading.Lock()
+        self._pending = {}  # job_id -> Future
+        self._ids = itertools.count()
+        self._trackers = {}  # cam_id -> PoseTracker (people and their fall state are per camera)
+        self._started = None
+        self._loaded = 0     # Workers whose model finished loading
+        self._load_errors = []
+        self._load_seconds = None
+
+        self._submitted = 0
+        self._completed = 0
+        self._batches = 0
+        self._dropped = 0
+        self._expired = 0
+        self._errors = 0
+
+    def start(self):
+        self._started = time.perf_counter()
+        for i in range(self.num_workers):
+            p = self._ctx.Process(
+                target=_worker_main,
+                args=(self._jobs, self._results, self.batch_size, self.num_poses),
+                name=f"pose-worker-{i}",
+                daemon=True
+            )
+            p.start()
+            self._workers.append(p)
+
+        self._collector = threading.Thread(target=self._collect, name="pose-collector", daemon=True)
+        self._collector.start()
+        return self
+
+    def stop(self):
+        for _ in self._workers:
+            self._jobs.put(None)
+        for p in self._workers:
+            p.join(timeout=2)
+        self._results.put(None)
+        self._workers = []
+
+    @property
+    def serving(self):
+        """True once at least one worker has loaded its model; frames sent earlier would only queue up."""
+        return self._loaded > 0
+
+    def submit(self, frame, timeout=None):
+        """
+        Queues a mirrored frame for detection and returns a Future for its landmarks.
+        Raises queue.Full when the scheduler is saturated; callers should drop the frame.
+        A frame still queued `timeout` seconds from now is skipped by the workers.
+        """
+        return self._submit(frame, timeout)[1]
+
+    def _submit(self, frame, timeout=None):
+        job_id = next(self._ids)
+        future = Future()
+        with self._lock:
+            self._pending[job_id] = future
+
+        expires = time.monotonic() + timeout if timeout is not None else None
+        try:
+            self._jobs.put_nowait((job_id, frame, expires))
+        except queue.Full:
+            with self._lock:
+                self._pending.pop(job_id, None)
+                self._dropped += 1
+            raise
+
+        with self._lock:
+            self._submitted += 1
+        return job_id, future
+
+    def infer(self, cam_id, frame, timeout=2.0):
+        """
+        Detects and classifies one frame for a camera.
+        Returns (poses (K, 33, 2), track ids (K,), [alert or None per person]).
+        Raises TimeoutError if no worker answers within `timeout` seconds.
+        """
+        job_id, future = self._submit(frame, timeout)
+        try:
+            poses = future.result(timeout=timeout)
+        finally:
+            # On timeout, forget the job so a late result doesn't leak
+            with self._lock:
+                self._pending.pop(job_id, None)
+
+        # One frame per camera is in flight at a time, so its tracker needs no lock
+        tracker = self._trackers.setdefault(cam_id, PoseTracker())
+        ids, alerts = tracker.classify(poses)
+        return poses, ids, alerts
+
+    def queue_depth(self):
+        try:
+            return self._jobs.qsize()
+        except NotImplementedError:  # macOS
+            with self._lock:
+                return len(self._pending)
+
+    def status(self):
+        """Readiness: each worker loads its model after start(), in parallel with everything else."""
+        with self._lock:
+            loaded, errors, seconds = self._loaded, list(self._load_errors), self._load_seconds
+        if self._started is None:
+            state = "cold"
+        elif loaded == self.num_workers:
+            state = "ready"
+        elif errors:
+            state = "failed" if loaded == 0 and len(errors) == self.num_workers else "degraded"
+        else:
+            state = "warming"
+        return {
+            "ready": loaded > 0 and state in ("ready", "degraded"),
+            "state": state,
+            "workers": self.num_workers,
+            "loaded": loaded,
+            "seconds": round(seconds, 3) if seconds is not None else None,
+            "error": errors[0] if errors else None,
+        }
+
+    def stats(self):
+        depth = self.queue_depth()
+        with self._lock:
+            return {
+                "workers": self.num_workers,
+                "alive_workers": sum(p.is_alive() for p in self._workers),
+                "batch_size": self.batch_size,
+                "num_poses": self.num_poses,
+                "queue_capacity": self.max_queue,
+                "queue_depth": depth,
+                "in_flight": len(self._pending),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "batches": self._batches,
+                "avg_batch": round(self._completed / self._batches, 2) if self._batches else 0,
+                "dropped": self._dropped,
+                "expired": self._expired,
+                "errors": self._errors,
+            }
+
+    def _collect(self):
+        """Routes batched results from the workers back to the waiting camera threads."""
+        while True:
+            batch = self._results.get()
+            if batch is None:
+                return
+            if isinstance(batch, tuple):  # ("ready" | "failed", error), once per worker
+                status, error = batch
+                with self._lock:
+                    if status == "ready":
+                        self._loaded += 1
+                        if self._loaded == self.num_workers:
+                            self._load_seconds = time.perf_counter() - self._started
+                    else:
+                        self._load_errors.append(error)
+                        print(f"❌ Pose worker failed to load: {error}")
+                continue
+
+            with self._lock:
+                self._batches += 1
+                for job_id, landmarks, error in batch:
+                    self._completed += 1
+                    future = self._pending.pop(job_id, None)
+                    if error == EXPIRED:
+                        self._expired += 1
+                    elif error:
+                        self._errors += 1
+                    if future is None:
+                        continue
+                    if error == EXPIRED:
+                        future.set_exception(TimeoutError("frame expired in the inference queue"))
+                    elif error:
+                        future.set_exception(RuntimeError(error))
+                    else:
+                        future.set_result(landmarks)
@@ -1,54 +1,128 @@
+import argparse
+import hashlib
 import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_chroma import Chroma
+from retrieval import get_embeddings, COLLECTIONS
 
 # 1. SETUP
 load_dotenv()
-if not os.getenv("GOOGLE_API_KEY"):
-    raise ValueError("❌ GOOGLE_API_KEY not found in .env file")
 
 PDF_PATH = "esi_handbook.pdf"
 DB_PATH = "./chroma_db"
+EMBEDDING_CACHE = "./embedding_cache.sqlite"
 
-def ingest():
-    print(f"📄 Loading {PDF_PATH}...")
-    if not os.path.exists(PDF_PATH):
-        print(f"❌ Error: {PDF_PATH} not found. Please add the PDF to this folder.")
-        return
-
-    # 1. Load PDF
-    loader = PyPDFLoader(PDF_PATH)
+def load_chunks(path, text_splitter):
+    """Loads one source document (PDF or plain text) and splits it into chunks."""
+    loader = PyPDFLoader(path) if path.lower().endswith(".pdf") else TextLoader(path, encoding="utf-8")
     pages = loader.load()
-    print(f"   Found {len(pages)} pages.")
+    chunks = text_splitter.split_documents(pages)
+    print(f"   {path}: {len(pages)} pages -> {len(chunks)} chunks.")
+    return chunks
+
+def chunk_id(chunk):
+    """Stable id from the chunk's source and text, so re-runs can recognise it."""
+    source = os.path.basename(chunk.metadata.get("source", ""))
+    return hashlib.sha256(f"{source}\0{chunk.page_content}".encode("utf-8")).hexdigest()
+
+def with_retry(fn, *args, retries=5, base_delay=1.0, max_delay=30.0):
+    """Calls fn, retrying with exponential backoff + jitter (rate limits, timeouts)."""
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+            print(f"   ⚠️ {e.__class__.__name__}: {e}. Retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+def existing_ids(vectorstore, ids, page_size=500):
+    found = set()
+    for i in range(0, len(ids), page_size):
+        found.update(vectorstore.get(ids=ids[i:i + page_size], include=[])["ids"])
+    return found
+
+def ingest(sources, batch_size=64, workers=4, rebuild=False, backend="google"):
+    if backend == "google" and not os.getenv("GOOGLE_API_KEY"):
+        raise ValueError("❌ GOOGLE_API_KEY not found in .env file")
+
+    missing = [path for path in sources if not os.path.exists(path)]
+    if missing:
+        print(f"❌ Error: {', '.join(missing)} not found. Please add the document(s) to this folder.")
+        return
 
-    # 2. Split Text (Chunking)
+    # 1. Load & Split Text (Chunking)
     # We use a large chunk size (1000) with overlap (200) to keep medical context intact.
+    print(f"📄 Loading {len(sources)} source document(s)...")
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=200,
         separators=["\n\n", "\n", " ", ""]
     )
-    chunks = text_splitter.split_documents(pages)
-    print(f"   Created {len(chunks)} knowledge chunks.")
-
-    # 3. Embed & Store (Chroma Local)
-    print("🧠 Vectorizing and storing (this may take a moment)...")
-    
-    # Initialize Embedding Model
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
-    
-    # Create Vector Store
-    # This automatically saves to the './chroma_db' folder
-    vectorstore = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=DB_PATH
+    chunks = {}
+    for path in sources:
+        for chunk in load_chunks(path, text_splitter):
+            chunks.setdefault(chunk_id(chunk), chunk)  # Identical chunks are stored once
+    print(f"   Created {len(chunks)} unique knowledge chunks.")
+
+    # 2. Open the existing store and skip what's already in it
+    # Cached: chunks embedded before (even in a dropped collection) cost nothing
+    embeddings = get_embeddings(backend, EMBEDDING_CACHE)
+    store_kwargs = dict(
+        persist_directory=DB_PATH,
+        collection_name=COLLECTIONS[backend],
+        embedding_function=embeddings
     )
-    
-    print(f"✅ Success! Knowledge Base saved to {DB_PATH}")
+    vectorstore = Chroma(**store_kwargs)
+    if rebuild:
+        print("🗑️ Dropping existing collection...")
+        vectorstore.delete_collection()
+        vectorstore = Chroma(**store_kwargs)
+
+    ids = list(chunks)
+    present = existing_ids(vectorstore, ids)
+    new_ids = [i for i in ids if i not in present]
+    print(f"   {len(present)} chunks already stored, {len(new_ids)} to embed.")
+    if not new_ids:
+        print(f"✅ Knowledge Base at {DB_PATH} is up to date.")
+        return
+
+    # 3. Embed & Store in parallel batches
+    # Chroma upserts by id, so a retried batch never duplicates anything.
+    print(f"🧠 Vectorizing in batches of {batch_size} with {workers} workers...")
+    batches = [new_ids[i:i + batch_size] for i in range(0, len(new_ids), batch_size)]
+
+    def store_batch(batch):
+        texts = [chunks[i].page_content for i in batch]
+        metadatas = [chunks[i].metadata for i in batch]
+        with_retry(vectorstore.add_texts, texts, metadatas, batch)
+        return len(batch)
+
+    start = time.perf_counter()
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in as_completed([pool.submit(store_batch, batch) for batch in batches]):
+            done += future.result()
+            elapsed = time.perf_counter() - start
+            print(f"   [{done}/{len(new_ids)}] {done / elapsed:.1f} chunks/s")
+
+    print(f"✅ Success! Added {len(new_ids)} chunks to {DB_PATH} in {time.perf_counter() - start:.1f}s")
 
 if __name__ == "__main__":
-    ingest()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Incrementally ingest documents into the ESI knowledge base.")
+    parser.add_argument("sources", nargs="*", default=[PDF_PATH], help="PDF or text files (default: %(default)s)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rebuild", action="store_true", help="drop the collection and re-embed everything")
+    parser.add_argument("--backend", choices=sorted(COLLECTIONS), default="google",
+                        help="embedding backend; 'local' runs fully offline, 'stub' is for benchmarks")
+    args = parser.parse_args()
+
+    ingest(args.sources, batch_size=args.batch_size, workers=args.workers,
+           rebuild=args.rebuild, backend=args.backend)
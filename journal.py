@@ -0,0 +1,237 @@
+# journal.py
+import atexit
+import json
+import os
+import threading
+import time
+
+class PatientJournal:
+    """
+    Append-only, crash-safe log of patient queue events (add / update / done).
+
+    Events are buffered and written by one background thread with group commit:
+    whatever accumulates while the previous fsync runs goes out in the next
+    write + fsync, so intake never waits on the disk. Every `snapshot_every`
+    events the writer compacts the queue into snapshot.json and starts a fresh
+    log, which keeps restart replay bounded.
+    """
+    def __init__(self, path="./journal", snapshot_every=5000, fsync=True):
+        self.path = os.path.abspath(path)
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.log_path = os.path.join(self.path, "journal.log")
+        self.snapshot_path = os.path.join(self.path, "snapshot.json")
+        os.makedirs(self.path, exist_ok=True)
+
+        self._cond = threading.Condition()
+        self._pending = []         # [(seq, event)] not yet written
+        self._seq = 0              # last assigned event seq
+        self._durable = 0          # last seq known to be on disk
+        self._snapshot_seq = 0     # seq covered by snapshot.json
+        self._since_snapshot = 0
+        self._closing = False
+        self._writer = None
+        self._snapshot_fn = None
+        self._file = None
+        self._torn = None          # log offset to cut back to after a failed commit
+
+        self._commits = 0
+        self._written = 0
+        self._snapshots = 0
+        self._errors = 0
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def load(self):
+        """
+        Reads the latest snapshot and the events logged after it.
+        Returns (snapshot state or None, [events]). A torn final line is ignored,
+        and so is any event whose seq was already replayed.
+        """
+        state = None
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                state = json.load(f)
+            self._snapshot_seq = state["seq"]
+
+        events = []
+        if os.path.exists(self.log_path):
+            good = 0
+            with open(self.log_path, "rb+") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("unterminated line")
+                        event = json.loads(line)
+                    except ValueError:
+                        # Crashed mid-write: nothing after this was acknowledged, and
+                        # new events must not be appended behind the torn line
+                        f.truncate(good)
+                        break
+                    good += len(line)
+                    # A retried commit may have landed twice; seqs only ever grow
+                    if event["seq"] > (events[-1]["seq"] if events else self._snapshot_seq):
+                        events.append(event)
+
+        self._seq = self._durable = events[-1]["seq"] if events else self._snapshot_seq
+        self._since_snapshot = len(events)
+        return state, events
+
+    def start(self, snapshot_fn):
+        """
+        Starts the writer. `snapshot_fn()` must return (seq, state) captured
+        atomically with respect to append(), i.e. under the caller's lock.
+        """
+        self._snapshot_fn = snapshot_fn
+        self._file = open(self.log_path, "a", encoding="utf-8")
+        self._writer = threading.Thread(target=self._run, name="patient-journal", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+        return self
+
+    def append(self, event):
+        """
+        Queues one event and returns its seq. Callers serialize appends in queue order.
+        Encoding happens on the writer thread, so the event must not be mutated afterwards.
+        """
+        with self._cond:
+            self._seq += 1
+            event["seq"] = self._seq
+            self._pending.append((self._seq, event))
+            self._cond.notify_all()
+            return self._seq
+
+    def flush(self, timeout=None):
+        """Blocks until every event appended so far is durable. Returns True if it is."""
+        with self._cond:
+            target = self._seq
+            return self._cond.wait_for(lambda: self._durable >= target or self._writer is None, timeout)
+
+    def close(self):
+        if self._writer is None:
+            return
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._writer.join(timeout=5)
+        self._writer = None
+        self._file.close()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "seq": self._seq,
+                "durable": self._durable,
+                "pending": len(self._pending),
+                "commits": self._commits,
+                "events_written": self._written,
+                "avg_batch": round(self._written / self._commits, 2) if self._commits else 0,
+                "snapshots": self._snapshots,
+                "snapshot_seq": self._snapshot_seq,
+                "errors": self._errors,
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # A long tail left over from the last run is compacted straight away
+                self._cond.wait_for(lambda: self._pending or self._closing
+                                    or self._since_snapshot >= self.snapshot_every)
+                batch, self._pending = self._pending, []
+                closing = self._closing
+
+            # Events already covered by a newer snapshot don't need logging
+            batch = [(seq, event) for seq, event in batch if seq > self._snapshot_seq]
+            if batch:
+                try:
+                    self._commit(batch)
+                except OSError as e:
+                    self._errors += 1
+                    print(f"❌ Journal write failed: {e}")
+                    time.sleep(1)
+                    with self._cond:
+                        self._pending[:0] = batch  # Retry ahead of newer events
+                    continue
+
+            if self._since_snapshot >= self.snapshot_every:
+                try:
+                    self._compact()
+                except OSError as e:
+                    self._errors += 1
+                    print(f"❌ Journal snapshot failed: {e}")
+
+            if closing:
+                with self._cond:
+                    if not self._pending:
+                        self._cond.notify_all()
+                        return
+
+    def _commit(self, batch):
+        if self._torn is not None:
+            self._rollback(self._torn)
+
+        # One write + one fsync for the whole batch (group commit)
+        start = self._file.tell()
+        try:
+            self._file.write("".join(json.dumps(event, default=str) + "\n" for _, event in batch))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except OSError:
+            # Part of the batch (or all of it, if only the fsync failed) may be in the log.
+            # The retry rewrites it from `start`, so neither a torn line nor duplicates stay behind.
+            self._torn = start
+            raise
+
+        with self._cond:
+            self._durable = batch[-1][0]
+            self._commits += 1
+            self._written += len(batch)
+            self._since_snapshot += len(batch)
+            self._cond.notify_all()
+
+    def _rollback(self, offset):
+        """Cuts the log back to `offset`, dropping whatever a failed commit left after it."""
+        try:
+            self._file.close()
+        except OSError:
+            pass  # The unwritten tail is being thrown away anyway
+        os.truncate(self.log_path, offset)
+        self._file = open(self.log_path, "a", encoding="utf-8")
+        self._torn = None
+
+    def _compact(self):
+        seq, state = self._snapshot_fn()
+        state["seq"] = seq
+        self._write_atomic(self.snapshot_path, json.dumps(state, default=str))
+
+        # The snapshot is durable, so the log can start over. A crash before this
+        # point just replays a log whose events the snapshot already covers.
+        self._snapshot_seq = seq
+        self._file.close()
+        self._write_atomic(self.log_path, "")
+        self._file = open(self.log_path, "a", encoding="utf-8")
+        self._torn = None
+
+        with self._cond:
+            self._durable = max(self._durable, seq)
+            self._since_snapshot = 0
+            self._snapshots += 1
+            self._cond.notify_all()
+
+    def _write_atomic(self, path, data):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        if self.fsync and hasattr(os, "O_DIRECTORY"):
+            fd = os.open(self.path, os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
@@ -0,0 +1,172 @@
+# metrics.py
+"""
+Minimal Prometheus-style metrics: fixed-bucket histograms and scrape-time
+gauges, rendered in the text exposition format for /metrics. Observing a value
+is a bisect plus two increments, so timers can stay on in production.
+"""
+import bisect
+import sys
+import threading
+import time
+from collections import Counter
+
+# Seconds: 1 ms .. 60 s, roughly x2.5 per step
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+def _number(value):
+    return repr(float(value)) if value not in (float("inf"), float("-inf")) else ("+Inf" if value > 0 else "-Inf")
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels (e.g. per camera)."""
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def time(self, *label_values):
+        """Context manager that observes the elapsed seconds of its block."""
+        return _Timer(self, label_values)
+
+    def quantile(self, q, *label_values):
+        """Upper bucket bound holding the q-th quantile (coarse, for quick checks)."""
+        with self._lock:
+            series = self._series.get(label_values)
+            counts = list(series[:-1]) if series else []
+        total = sum(counts)
+        if not total:
+            return None
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            if running >= q * total:
+                return bound
+
+    def collect(self):
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for label_values, series in sorted(snapshot.items()):
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                running += count
+                yield f"{self.name}_bucket{_labels(self.labels, label_values, [('le', _number(bound))])} {running}"
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {_number(series[-1])}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {running}"
+
+class Gauge:
+    """
+    Value read at scrape time from `fn`, so nothing is paid on the hot path.
+    `fn` returns a number, or a dict of label-value tuples -> number.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, fn, labels=()):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labels = tuple(labels)
+
+    def collect(self):
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in sorted(values.items()):
+            if value is not None:
+                yield f"{self.name}{_labels(self.labels, label_values)} {_number(value)}"
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        """Registers `metric`; a name that already exists keeps its first definition."""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def replace(self, metric):
+        """Registers `metric`, replacing any earlier one (scrape-time gauges bound to new state)."""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                body = list(metric.collect())
+            except Exception as e:  # A broken gauge must not take the whole scrape down
+                body = [f"# {metric.name} failed: {e.__class__.__name__}"]
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(body)
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, help, labels, buckets))
+
+def gauge(name, help, fn, labels=()):
+    return REGISTRY.replace(Gauge(name, help, fn, labels))
+
+# --- SAMPLING PROFILER ---
+
+def sample_stacks(seconds=5.0, interval=0.005, max_depth=64):
+    """
+    Poor man's sampling profiler: snapshots every thread's stack with
+    sys._current_frames() every `interval` seconds. Returns collapsed stacks
+    ("thread;module:function;... count" per line), ready for flamegraph.pl
+    or speedscope. Costs nothing until it is called.
+    """
+    me = threading.get_ident()
+    stacks = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            parts = []
+            while frame is not None and len(parts) < max_depth:
+                code = frame.f_code
+                parts.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+                frame = frame.f_back
+            stacks[";".join([names.get(ident, str(ident))] + parts[::-1])] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
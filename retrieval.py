@@ -0,0 +1,271 @@
+# retrieval.py
+import hashlib
+import re
+import sqlite3
+import threading
+from typing import Any
+import numpy as np
+from pydantic import ConfigDict
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+GOOGLE_MODEL = "models/text-embedding-004"
+LOCAL_MODEL = "all-MiniLM-L6-v2"
+STUB_MODEL = "stub-hashing-256"
+
+# Each backend embeds into its own vector space, so each gets its own Chroma collection.
+# "langchain" is Chroma's default, which is where ingest.py has always written.
+COLLECTIONS = {"google": "langchain", "local": "esi_local", "stub": "esi_stub"}
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+class LocalEmbeddings(Embeddings):
+    """
+    Offline embedding backend: the ONNX MiniLM-L6-v2 model bundled with chromadb,
+    run on onnxruntime. The model is downloaded once and cached by chromadb.
+    """
+    def __init__(self):
+        from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+        self._fn = ONNXMiniLM_L6_V2()
+
+    def embed_documents(self, texts, task_type=None):
+        # MiniLM uses the same space for queries and documents, so task_type is ignored
+        return [np.asarray(v, dtype=np.float32).tolist() for v in self._fn(list(texts))]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+class StubEmbeddings(Embeddings):
+    """
+    Deterministic stand-in for benchmarks and offline runs: a hashed bag of
+    words, L2-normalized. No model, no network, microseconds per text, and
+    complaints that share words still land near each other.
+    """
+    def __init__(self, dims=256):
+        self.dims = dims
+
+    def _embed(self, text):
+        vector = np.zeros(self.dims, dtype=np.float32)
+        for word in _WORD.findall(text.lower()):
+            h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[h % self.dims] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts, task_type=None):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+class CachedEmbeddings(Embeddings):
+    """
+    Persistent on-disk cache in front of any embedding function.
+    Vectors are stored as float32 blobs in SQLite, keyed by (model, kind, sha256(text)),
+    so repeated complaints and re-ingested chunks never hit the network twice.
+    """
+    def __init__(self, embeddings, model, path="./embedding_cache.sqlite"):
+        self.embeddings = embeddings
+        self.model = model
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, hash))"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def _hash(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, model, hashes, page_size=500):
+        found = {}
+        with self._lock:
+            for i in range(0, len(hashes), page_size):
+                page = hashes[i:i + page_size]
+                rows = self._db.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(page))})",
+                    [model, *page]
+                )
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def _store(self, model, items):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(model, h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in items]
+            )
+            self._db.commit()
+
+    def embed_documents(self, texts):
+        # Query and document embeddings can differ (task types), so they're cached apart
+        model = f"{self.model}:document"
+        hashes = [self._hash(t) for t in texts]
+        found = self._lookup(model, list(set(hashes)))
+
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in found:
+                missing.setdefault(h, text)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            fresh = list(zip(missing, vectors))
+            self._store(model, fresh)
+            found.update((h, list(v)) for h, v in fresh)
+        return [found[h] for h in hashes]
+
+    def embed_queries(self, texts):
+        """Batch version of embed_query: one cache lookup, one API call for the misses."""
+        model = f"{self.model}:query"
+        hashes = [self._hash(t) for t in texts]
+        found = self._lookup(model, list(set(hashes)))
+
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in found:
+                missing.setdefault(h, text)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            fresh = list(zip(missing, embed_queries(self.embeddings, list(missing.values()))))
+            self._store(model, fresh)
+            found.update((h, list(v)) for h, v in fresh)
+        return [found[h] for h in hashes]
+
+    def embed_query(self, text):
+        model = f"{self.model}:query"
+        h = self._hash(text)
+        found = self._lookup(model, [h])
+        if h in found:
+            self.hits += 1
+            return found[h]
+
+        self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        self._store(model, [(h, vector)])
+        return list(vector)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+def embed_queries(embeddings, texts):
+    """Embeds many queries at once. Google's batch call takes a task type; others just loop."""
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    try:
+        return embeddings.embed_documents(texts, task_type="RETRIEVAL_QUERY")
+    except TypeError:
+        return [embeddings.embed_query(t) for t in texts]
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class NumpyRetriever(BaseRetriever):
+    """
+    In-memory drop-in retriever for the handbook.
+    Every chunk vector in the Chroma collection is loaded once into a single
+    normalized float32 matrix, so top-k is one matrix-vector product (and a
+    batch of queries is one matmul). Ranking is by cosine similarity.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    embeddings: Embeddings
+    documents: list
+    matrix: Any
+    k: int = 3
+
+    @classmethod
+    def from_chroma(cls, vectorstore, embeddings, k=3):
+        data = vectorstore.get(include=["embeddings", "documents", "metadatas"])
+        if len(data["ids"]) == 0:
+            matrix = np.zeros((0, 1), dtype=np.float32)
+        else:
+            matrix = np.ascontiguousarray(_normalize(np.asarray(data["embeddings"], dtype=np.float32)))
+        documents = [
+            Document(page_content=text, metadata=metadata or {}, id=doc_id)
+            for doc_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"])
+        ]
+        return cls(embeddings=embeddings, documents=documents, matrix=matrix, k=k)
+
+    def search_by_vectors(self, vectors, k=None):
+        """Top-k documents for each query vector. Returns one list per query."""
+        k = min(k or self.k, len(self.documents))
+        if k == 0:
+            return [[] for _ in vectors]
+
+        queries = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1))
+        scores = queries @ self.matrix.T                       # (queries, chunks)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]   # unordered top-k
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        return [[self.documents[i] for i in row] for row in top]
+
+    def batch_search(self, queries, k=None):
+        """Scores many complaints against the handbook in one pass."""
+        return self.search_by_vectors(embed_queries(self.embeddings, queries), k)
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.search_by_vectors([self.embeddings.embed_query(query)])[0]
+
+def _google_embeddings(timeout=None):
+    """
+    GoogleGenerativeAIEmbeddings whose API requests give up after `timeout` seconds.
+    The client has no timeout option of its own (`request_options` is accepted but
+    never sent), so it rides on each request's EmbedContentConfig.
+    """
+    from google.genai.types import HttpOptions
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    if not timeout:
+        return GoogleGenerativeAIEmbeddings(model=GOOGLE_MODEL)
+
+    class TimedGoogleEmbeddings(GoogleGenerativeAIEmbeddings):
+        def _build_config(self, **kwargs):
+            config = super()._build_config(**kwargs)
+            config.http_options = HttpOptions(timeout=int(timeout * 1000))  # milliseconds
+            return config
+
+    return TimedGoogleEmbeddings(model=GOOGLE_MODEL)
+
+def get_embeddings(backend="google", cache_path="./embedding_cache.sqlite", timeout=None):
+    """
+    Builds the configured embedding function ("google", "local" or "stub"),
+    wrapped in the on-disk cache unless cache_path is empty. `timeout` bounds
+    each Google API request, so a slow API fails the triage fast instead of
+    holding it until the job deadline. There is no fallback to another backend:
+    each one embeds into its own collection's vector space.
+    """
+    if backend == "google":
+        base, model = _google_embeddings(timeout), GOOGLE_MODEL
+    elif backend == "local":
+        base, model = LocalEmbeddings(), LOCAL_MODEL
+    elif backend == "stub":
+        base, model = StubEmbeddings(), STUB_MODEL
+    else:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    if not cache_path:
+        return base
+    return CachedEmbeddings(base, model, cache_path)
@@ -1,29 +1,234 @@
 # services.py
+import bisect
+import itertools
 import os
+import queue
 import re
+import threading
+import time
 import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
 from datetime import datetime
+import numpy as np
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_chroma import Chroma
-from langchain_classic.prompts import PromptTemplate
-from langchain_classic.chains import RetrievalQA
+from metrics import histogram
+
+RETRIEVAL_SECONDS = histogram("codeblue_retrieval_seconds", "Handbook retrieval latency per call", labels=("mode",))
+GENERATION_SECONDS = histogram("codeblue_generation_seconds", "LLM generation latency per patient")
+FIRST_TOKEN_SECONDS = histogram("codeblue_first_token_seconds", "Streaming: request to first LLM token")
+
+# Patients still waiting on the LLM rank after confirmed ESI 1-2 but ahead of 3-5
+PENDING_ESI_RANK = 2.5
+
+def _esi_rank(patient):
+    return PENDING_ESI_RANK if patient['esi'] is None else patient['esi']
 
 class PatientManager:
-    """Manages the in-memory patient queue."""
-    def __init__(self):
-        self.patients = []
+    """
+    Manages the in-memory patient queue.
+    Records are indexed by id, active patients are kept in (ESI, arrival) order
+    with bisect, and completed patients move into a capped history.
+
+    Thread safety: all writers serialize on one short lock. Published records are
+    never mutated (updates swap in a new dict), so readers get immutable
+    snapshots and only hold the lock long enough to copy two key lists.
+
+    With a `journal` (see journal.PatientJournal) every mutation is logged and
+    the queue is rebuilt from the latest snapshot + log tail on startup.
+    """
+    def __init__(self, history_size=500, change_log=5000, journal=None):
+        self.history_size = history_size
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._seq = itertools.count()
+
+        # Sort keys are (rank, arrival seq, id, record); ids are unique so the
+        # record itself is never compared, it just rides along for readers.
+        self._by_id = {}           # id -> record (active + history)
+        self._keys = {}            # id -> sort key
+        self._active = {}          # id -> record, in arrival order
+        self._order = []           # sorted keys of active patients
+        self._history = deque()    # completed ids, oldest first
+        self._history_order = []   # sorted keys of completed patients
+        self._dedup = {}           # dedup key -> id of the active patient holding it
+
+        self._version = 0          # bumped on every mutation
+        self._snapshot = (0, ())   # (version, immutable listing) last built by a reader
+        self._changes = deque(maxlen=change_log)  # (version, patient id)
+
+        self._journal = journal
+        if journal is not None:
+            start = time.perf_counter()
+            state, events = journal.load()
+            self._restore(state, events)
+            journal.start(self._journal_state)
+            if state or events:
+                print(f"📒 Restored {len(self._active)} active patients from {journal.path} "
+                      f"({len(events)} events replayed in {time.perf_counter() - start:.2f}s)")
+
+    @property
+    def version(self):
+        return self._version
 
     def get_all(self):
-        # Sort: Code Black (0) -> Critical (1-2) -> Stable (3-5)
+        return self.get_versioned()[1]
+
+    def get_versioned(self):
+        """Returns (version, ordered listing) as one consistent, immutable pair."""
+        # Sort: Code Black (0) -> Critical (1-2) -> Pending -> Stable (3-5)
         # Also sort Active before Completed
-        return sorted(self.patients, key=lambda x: (x['status'] == 'completed', x['esi']))
+        snapshot = self._snapshot
+        if snapshot[0] == self._version:
+            return snapshot
+
+        with self._lock:
+            version = self._version
+            keys = self._order + self._history_order
+        listing = tuple(key[3] for key in keys)
+
+        # Another reader may have published a newer one meanwhile
+        if version >= self._snapshot[0]:
+            self._snapshot = (version, listing)
+        return version, listing
+
+    def changes_since(self, since):
+        """
+        Delta for clients that already hold version `since`:
+        { version, full, patients: [changed records], removed: [ids] }.
+        Falls back to a full listing if `since` is older than the change log.
+        """
+        with self._lock:
+            # The oldest logged version may be partially truncated, so require since >= it.
+            # An empty log (e.g. right after a restore) can't describe any gap.
+            truncated = since < self._version and (not self._changes or since < self._changes[0][0])
+            if since > self._version or truncated:
+                version, listing = self.get_versioned()
+                return {"version": version, "full": True, "patients": listing, "removed": []}
+
+            changed = {}
+            for version, patient_id in reversed(self._changes):
+                if version <= since:
+                    break
+                changed.setdefault(patient_id, self._by_id.get(patient_id))
+
+            return {
+                "version": self._version,
+                "full": False,
+                "patients": [p for p in changed.values() if p is not None],
+                "removed": [i for i, p in changed.items() if p is None],
+            }
+
+    def wait_for_change(self, since, timeout=None):
+        """Blocks until the queue moves past version `since`. Returns True if it did."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self._version != since, timeout)
+
+    def _bump(self, *patient_ids):
+        # Caller holds the lock
+        self._version += 1
+        for patient_id in patient_ids:
+            self._changes.append((self._version, patient_id))
+        self._changed.notify_all()
+
+    def _log(self, op, **event):
+        # Caller holds the lock (and has bumped), so the journal sees events in queue order
+        if self._journal is not None:
+            self._journal.append({"op": op, "version": self._version, **event})
+
+    def _journal_state(self):
+        """Compacted queue state for PatientJournal snapshots, consistent with its seq."""
+        with self._lock:
+            return self._journal.seq, {
+                "version": self._version,
+                "active": list(self._active.values()),
+                "history": [self._by_id[i] for i in self._history],
+                "dedup": dict(self._dedup),
+            }
+
+    def _restore(self, state, events):
+        with self._lock:
+            if state:
+                for record in state["active"]:
+                    self._insert(record)
+                for record in state["history"]:
+                    self._insert(record)
+                    self._complete(record["id"])
+                self._dedup.update(state["dedup"])
+                self._version = state["version"]
+
+            for event in events:
+                patient_id = event.get("id")
+                if event["op"] == "add":
+                    self._insert(event["record"])
+                    if event.get("dedup"):
+                        self._dedup[event["dedup"]] = event["record"]["id"]
+                elif event["op"] == "update" and patient_id in self._by_id:
+                    self._replace(patient_id, {**self._by_id[patient_id], **event["fields"]})
+                elif event["op"] == "done" and patient_id in self._active:
+                    self._complete(patient_id)
+                self._version = event["version"]
+
+            # New arrivals must sort after everything restored
+            self._seq = itertools.count(max((key[1] for key in self._keys.values()), default=-1) + 1)
 
     def get_active(self):
-        return [p for p in self.patients if p['status'] == 'active']
+        with self._lock:
+            return list(self._active.values())
+
+    def get(self, patient_id):
+        return self._by_id.get(patient_id)
+
+    def counts(self):
+        """{"active": n, "completed": m} without building a listing."""
+        return {"active": len(self._active), "completed": len(self._history)}
+
+    def is_open(self, dedup_key):
+        """True while an active patient holds this dedup key (see add_patient_if_new)."""
+        return dedup_key in self._dedup
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def add_patient(self, name, age, complaint, esi, analysis, source_docs=[], snapshot=None, thumbnail=None, triage="done"):
+        new_patient = self._new_record(name, age, complaint, esi, analysis, source_docs, snapshot, thumbnail, triage)
+        with self._lock:
+            self._insert(new_patient)
+            self._bump(new_patient['id'])
+            self._log("add", record=new_patient)
+        return new_patient
+
+    def add_patient_if_new(self, dedup_key, **patient):
+        """
+        Atomic check-and-insert: adds the patient unless an active one already
+        holds `dedup_key` (e.g. the same camera alert). Returns the new record or None.
+        The key is released when that patient is marked done.
+        """
+        if dedup_key in self._dedup:
+            return None
+        new_patient = self._new_record(**patient)
+        with self._lock:
+            if dedup_key in self._dedup:
+                return None
+            self._insert(new_patient)
+            self._dedup[dedup_key] = new_patient['id']
+            self._bump(new_patient['id'])
+            self._log("add", record=new_patient, dedup=dedup_key)
+        return new_patient
 
-    def add_patient(self, name, age, complaint, esi, analysis, source_docs=[], snapshot=None):
-        new_patient = {
+    def add_patients(self, patients):
+        """Inserts many patients (dicts of add_patient arguments) in one locked operation."""
+        records = [self._new_record(**p) for p in patients]
+        with self._lock:
+            for record in records:
+                self._insert(record)
+            self._bump(*(r['id'] for r in records))
+            for record in records:
+                self._log("add", record=record)
+        return records
+
+    def _new_record(self, name, age, complaint, esi, analysis, source_docs=[], snapshot=None, thumbnail=None, triage="done", **extra):
+        return {
             "id": str(uuid.uuid4()),
             "time": datetime.now().strftime("%H:%M:%S"),
             "name": name,
@@ -33,37 +238,315 @@ class PatientManager:
             "analysis": analysis,
             "source_docs": source_docs, # Note: Objects might need serialization for JSON API
             "status": "active",
-            "snapshot": snapshot # Base64 string or path ideally, or raw bytes if internal
+            "triage": triage, # pending -> running -> done / failed
+            "snapshot": snapshot, # URL of the full image (see SnapshotStore)
+            "thumbnail": thumbnail,
+            **extra # e.g. alert_start / alert_end for camera events
         }
-        self.patients.append(new_patient)
-        return new_patient
+
+    def _insert(self, record):
+        # Caller holds the lock; the record isn't visible to anyone yet.
+        # Restored records keep their original arrival.
+        if "arrival" not in record:
+            record["arrival"] = next(self._seq)
+        key = (_esi_rank(record), record["arrival"], record['id'], record)
+        self._by_id[key[2]] = record
+        self._keys[key[2]] = key
+        self._active[key[2]] = record
+        bisect.insort(self._order, key)
+
+    def _replace(self, patient_id, record):
+        # Caller holds the lock. Swaps in a new record, re-slotting it if its rank changed.
+        old_key = self._keys[patient_id]
+        active = patient_id in self._active
+        order = self._order if active else self._history_order
+        new_key = (_esi_rank(record), old_key[1], patient_id, record)
+
+        i = bisect.bisect_left(order, old_key)
+        if new_key[0] == old_key[0]:
+            order[i] = new_key
+        else:
+            del order[i]
+            bisect.insort(order, new_key)
+
+        self._keys[patient_id] = new_key
+        self._by_id[patient_id] = record
+        if active:
+            self._active[patient_id] = record
+
+    def update_patient(self, patient_id, **fields):
+        """Updates a record (e.g. when an async analysis lands). Readers keep the old copy."""
+        with self._lock:
+            p = self._by_id.get(patient_id)
+            if p is None:
+                return False
+            self._replace(patient_id, {**p, **fields})
+            self._bump(patient_id)
+            self._log("update", id=patient_id, fields=fields)
+            return True
 
     def mark_done(self, patient_id):
-        for p in self.patients:
-            if p['id'] == patient_id:
-                p['status'] = 'completed'
-                return True
-        return False
+        with self._lock:
+            if patient_id not in self._active:
+                return False
+            evicted = self._complete(patient_id)
+            self._bump(patient_id, *evicted)
+            self._log("done", id=patient_id)
+            return True
 
-class TriageService:
-    """Handles the RAG / LLM Logic."""
-    def __init__(self):
-        load_dotenv()
-        if not os.getenv("GOOGLE_API_KEY"):
-            raise ValueError("❌ GOOGLE_API_KEY missing.")
-        
-        self.chain = self._load_chain()
+    def _complete(self, patient_id):
+        # Caller holds the lock. Moves an active patient to history; returns evicted ids.
+        self._replace(patient_id, {**self._active[patient_id], 'status': 'completed'})
+        del self._active[patient_id]
+        for dedup_key, holder in list(self._dedup.items()):
+            if holder == patient_id:
+                del self._dedup[dedup_key]
+
+        key = self._keys[patient_id]
+        del self._order[bisect.bisect_left(self._order, key)]
+        bisect.insort(self._history_order, key)
+        self._history.append(patient_id)
+
+        # Archive: only the most recent completions are kept around
+        evicted = []
+        while len(self._history) > self.history_size:
+            old_id = self._history.popleft()
+            old_key = self._keys.pop(old_id)
+            del self._history_order[bisect.bisect_left(self._history_order, old_key)]
+            del self._by_id[old_id]
+            evicted.append(old_id)
+        return evicted
+
+class TriageCache:
+    """
+    LRU + TTL cache of triage results, keyed on normalized (age, complaint).
+    With an `embed_fn`, a miss falls back to a nearest-neighbour match on the
+    complaint embedding (same age only) above a cosine similarity threshold.
+    `embed_many_fn` (texts -> vectors) lets get_many() embed a batch in one call.
+    """
+    def __init__(self, max_size=512, ttl=900, embed_fn=None, similarity=0.97, embed_many_fn=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.embed_fn = embed_fn
+        self.embed_many_fn = embed_many_fn
+        self.similarity = similarity
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value, unit vector or None)
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(age, complaint):
+        """Case, punctuation and whitespace don't change a triage answer."""
+        text = re.sub(r"[^a-z0-9]+", " ", str(complaint).lower())
+        return str(age).strip(), " ".join(text.split())
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, age, complaint):
+        """Returns (cached value or None, query vector or None). Pass the vector back to put()."""
+        key = self.normalize(age, complaint)
+        found = self._exact(key)
+        if found is not None:
+            return found
+        if self.embed_fn is None:
+            return self._miss(None)
+        return self._nearest(key, self._unit(self.embed_fn(key[1])))
+
+    def get_many(self, cases):
+        """get() for many (age, complaint) pairs; complaints without an exact hit are embedded together."""
+        keys = [self.normalize(age, complaint) for age, complaint in cases]
+        results = [self._exact(key) for key in keys]
+        missing = [i for i, found in enumerate(results) if found is None]
+        if not missing:
+            return results
 
-    def _load_chain(self):
-        embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
-        vectorstore = Chroma(persist_directory="./chroma_db", embedding_function=embeddings)
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
+        if self.embed_many_fn is not None:
+            vectors = self.embed_many_fn([keys[i][1] for i in missing])
+        elif self.embed_fn is not None:
+            vectors = [self.embed_fn(keys[i][1]) for i in missing]
+        else:
+            vectors = None
+        for n, i in enumerate(missing):
+            results[i] = self._nearest(keys[i], self._unit(vectors[n])) if vectors is not None else self._miss(None)
+        return results
 
-        llm = ChatGoogleGenerativeAI(
+    def _exact(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[2]
+            if entry:
+                del self._entries[key]
+        return None
+
+    def _nearest(self, key, vector):
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                (k, e) for k, e in self._entries.items()
+                if k[0] == key[0] and e[0] > now and e[2] is not None
+            ]
+            if candidates:
+                scores = np.stack([e[2] for _, e in candidates]) @ vector
+                best = int(scores.argmax())
+                if scores[best] >= self.similarity:
+                    best_key, best_entry = candidates[best]
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    return best_entry[1], vector
+        return self._miss(vector)
+
+    def _miss(self, vector):
+        with self._lock:
+            self.misses += 1
+        return None, vector
+
+    def put(self, age, complaint, value, vector=None):
+        key = self.normalize(age, complaint)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.semantic_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+def get_llm(backend="google", timeout=60):
+    """Builds the chat model: "google" (Gemini) or "stub" (offline, see stub_llm.StubChatModel)."""
+    if backend == "google":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(
             model="gemini-flash-latest",
             temperature=0.1,
+            timeout=timeout,
             convert_system_message_to_human=True
         )
+    if backend == "stub":
+        from stub_llm import StubChatModel
+        return StubChatModel(latency=float(os.getenv("STUB_LLM_LATENCY", "0.5")))
+    raise ValueError(f"Unknown LLM backend: {backend}")
+
+class TriageService:
+    """
+    Handles the RAG / LLM Logic.
+
+    Construction is cheap: the embeddings, vector store, retriever and LLM load on the
+    first call that needs them, or ahead of time via warm() (e.g. from a
+    background thread), so the server can start serving before they're ready.
+    """
+    def __init__(self, cache_size=512, cache_ttl=900, semantic_threshold=None, llm_timeout=60,
+                 embedding_backend="google", embedding_cache="./embedding_cache.sqlite",
+                 retriever_backend="chroma", llm_backend="google", llm_concurrency=8,
+                 embedding_timeout=10):
+        self.llm_backend = llm_backend
+        self.llm_timeout = llm_timeout
+        self.embedding_backend = embedding_backend
+        self.embedding_cache = embedding_cache
+        self.embedding_timeout = embedding_timeout
+        self.retriever_backend = retriever_backend
+        self.embeddings = None
+        self.retriever = None
+        self.llm = None
+
+        self._warm_lock = threading.Lock()
+        self.state = "cold"         # cold -> warming -> ready (or failed, retried on next use)
+        self.warm_seconds = None
+        self.warm_error = None
+
+        # Repeat presentations skip retrieval + LLM entirely
+        self.cache = TriageCache(
+            max_size=cache_size,
+            ttl=cache_ttl,
+            embed_fn=self._embed_query if semantic_threshold else None,
+            embed_many_fn=self._embed_queries if semantic_threshold else None,
+            similarity=semantic_threshold or 1.0
+        )
+
+        # One bound on LLM calls in flight across single, streaming and batch triage,
+        # however many batches arrive at once (rate limits are per API key)
+        self._llm_slots = threading.BoundedSemaphore(llm_concurrency)
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def warm(self):
+        """Loads the embeddings, vector store, retriever and LLM once. Thread-safe; raises if loading fails."""
+        if self.state == "ready":
+            return self
+        with self._warm_lock:
+            if self.state == "ready":
+                return self
+            self.state = "warming"
+            start = time.perf_counter()
+            try:
+                load_dotenv()
+                if "google" in (self.llm_backend, self.embedding_backend) and not os.getenv("GOOGLE_API_KEY"):
+                    raise ValueError("❌ GOOGLE_API_KEY missing.")
+                from retrieval import get_embeddings
+                self.embeddings = get_embeddings(self.embedding_backend, self.embedding_cache, self.embedding_timeout)
+                self._load_pipeline()
+            except Exception as e:
+                self.state, self.warm_error = "failed", str(e)
+                raise
+            self.warm_seconds = time.perf_counter() - start
+            self.state, self.warm_error = "ready", None
+        return self
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "state": self.state,
+            "seconds": round(self.warm_seconds, 3) if self.warm_seconds is not None else None,
+            "error": self.warm_error,
+        }
+
+    def _embed_query(self, text):
+        return self.warm().embeddings.embed_query(text)
+
+    def _embed_queries(self, texts):
+        from retrieval import embed_queries
+        return embed_queries(self.warm().embeddings, texts)
+
+    def _load_pipeline(self):
+        # Imported here: langchain and the Chroma client take seconds to import
+        from langchain_chroma import Chroma
+        from langchain_classic.prompts import PromptTemplate
+        from retrieval import NumpyRetriever, COLLECTIONS
+
+        self.vectorstore = Chroma(
+            persist_directory="./chroma_db",
+            collection_name=COLLECTIONS[self.embedding_backend],
+            embedding_function=self.embeddings
+        )
+        if self.retriever_backend == "numpy":
+            # Whole handbook in one matrix; no Chroma round trip per query
+            retriever = NumpyRetriever.from_chroma(self.vectorstore, self.embeddings, k=3)
+        else:
+            retriever = self.vectorstore.as_retriever(search_kwargs={"k": 3})
+        self.retriever = retriever
+
+        self.llm = get_llm(self.llm_backend, self.llm_timeout)
 
         template = """
         You are an expert Triage Nurse Assistant using the ESI (Emergency Severity Index).
@@ -82,28 +565,388 @@ class TriageService:
         
         ANALYSIS:
         """
-        prompt = PromptTemplate(template=template, input_variables=["context", "question"])
-
-        return RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=retriever,
-            chain_type_kwargs={"prompt": prompt},
-            return_source_documents=True
-        )
+        self.prompt = PromptTemplate(template=template, input_variables=["context", "question"])
 
     def analyze(self, age, complaint):
+        cached, vector = self.cache.get(age, complaint)
+        if cached:
+            return cached
+
+        esi, result_text, docs = self._retrieve_and_generate(age, complaint)
+        if not result_text.startswith("Error:"):
+            self.cache.put(age, complaint, (esi, result_text, docs), vector)
+        return esi, result_text, docs
+
+    def _retrieve_and_generate(self, age, complaint):
+        # Retrieval, then the "stuff" step: the context goes straight into one prompt. Each half is timed
+        query = f"Age: {age}. Complaint: {complaint}"
+        try:
+            self.warm()
+            with RETRIEVAL_SECONDS.time("single"):
+                documents = self.retriever.invoke(query)
+        except Exception as e:
+            return 5, f"Error: {e}", []
+        return self._generate(query, documents)
+
+    def analyze_stream(self, age, complaint):
+        """
+        Streaming variant of analyze. Yields events as the model writes:
+          ("esi", level)   as soon as "ESI LEVEL: X" appears in the first tokens
+          ("token", text)  each new piece of the analysis
+          ("done", (esi, analysis, docs))  once, at the end
+        """
+        cached, vector = self.cache.get(age, complaint)
+        if cached:
+            yield "esi", cached[0]
+            yield "done", cached
+            return
+
+        query = f"Age: {age}. Complaint: {complaint}"
+        parts, esi = [], None
+        try:
+            self.warm()
+            with RETRIEVAL_SECONDS.time("single"):
+                documents = self.retriever.invoke(query)
+            context = "\n\n".join(doc.page_content for doc in documents)
+
+            with self._llm_slots:
+                start = time.perf_counter()
+                for chunk in self.llm.stream(self.prompt.format(context=context, question=query)):
+                    text = _message_text(chunk)
+                    if not text:
+                        continue
+                    if not parts:
+                        FIRST_TOKEN_SECONDS.observe(time.perf_counter() - start)
+                    parts.append(text)
+                    if esi is None:
+                        match = ESI_PATTERN.search("".join(parts))
+                        if match:
+                            esi = int(match.group(1))
+                            yield "esi", esi
+                    yield "token", text
+
+                GENERATION_SECONDS.observe(time.perf_counter() - start)
+            result_text = "".join(parts)
+            result = (_parse_esi(result_text), result_text, _summarize_docs(documents))
+            self.cache.put(age, complaint, result, vector)
+        except Exception as e:
+            # An ESI the model already wrote has been published; a late failure must not lose it
+            partial = "".join(parts)
+            result = (esi if esi is not None else 5, f"Error: {e}" + (f"\n\n{partial}" if partial else ""), [])
+        yield "done", result
+
+    def analyze_batch(self, patients, max_concurrency=8):
+        """
+        Triages many (age, complaint) pairs together for mass-casualty intake.
+        Cache hits come back first; the rest share one batched embedding + retrieval
+        pass, then LLM calls run with bounded concurrency (`max_concurrency` threads
+        per batch, and the service-wide LLM limit across batches).
+        Yields (index, esi, analysis, docs) as each patient finishes.
+        """
+        pending = []
+        lookups = self.cache.get_many(patients)
+        for i, ((age, complaint), (cached, vector)) in enumerate(zip(patients, lookups)):
+            if cached:
+                yield (i, *cached)
+            else:
+                pending.append((i, age, complaint, vector))
+        if not pending:
+            return
+
+        queries = [f"Age: {age}. Complaint: {complaint}" for _, age, complaint, _ in pending]
+        try:
+            contexts = self._retrieve_many(queries)
+        except Exception as e:
+            for i, *_ in pending:
+                yield i, 5, f"Error: {e}", []
+            return
+
+        pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="triage-batch")
+        try:
+            futures = {
+                pool.submit(self._generate, query, docs): item
+                for item, query, docs in zip(pending, queries, contexts)
+            }
+            for future in as_completed(futures):
+                i, age, complaint, vector = futures[future]
+                esi, result_text, docs = future.result()
+                if not result_text.startswith("Error:"):
+                    self.cache.put(age, complaint, (esi, result_text, docs), vector)
+                yield i, esi, result_text, docs
+        finally:
+            # A caller that stops reading early (e.g. past its deadline) doesn't pay for the rest
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _retrieve_many(self, queries):
+        """Context documents for many queries: one embedding call, one search pass."""
+        from retrieval import NumpyRetriever, embed_queries
+
+        self.warm()
+        with RETRIEVAL_SECONDS.time("batch"):
+            if isinstance(self.retriever, NumpyRetriever):
+                return self.retriever.batch_search(queries)
+            vectors = embed_queries(self.embeddings, queries)
+            return [self.vectorstore.similarity_search_by_vector(v, k=3) for v in vectors]
+
+    def _generate(self, query, docs):
+        """The "stuff" step, for callers that already have the context documents."""
+        try:
+            context = "\n\n".join(doc.page_content for doc in docs)
+            with self._llm_slots, GENERATION_SECONDS.time():
+                response = self.llm.invoke(self.prompt.format(context=context, question=query))
+            result_text = _message_text(response)
+            return _parse_esi(result_text), result_text, _summarize_docs(docs)
+        except Exception as e:
+            return 5, f"Error: {e}", []
+
+ESI_PATTERN = re.compile(r"ESI LEVEL:\s*(\d)")
+
+def _parse_esi(result_text):
+    # Extract ESI
+    match = ESI_PATTERN.search(result_text)
+    return int(match.group(1)) if match else 5
+
+def _summarize_docs(documents):
+    # Serialize docs for JSON response (get page content only)
+    return [doc.page_content[:200] + "..." for doc in documents]
+
+def _message_text(message):
+    """Chat models may return content as a string or as a list of parts."""
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+class TriageJobs:
+    """
+    Runs TriageService.analyze off the request thread on a bounded worker pool.
+    The patient is queued immediately with a provisional "pending" record that is
+    updated in place when the analysis lands. Job ids are patient ids.
+    With `stream`, the ESI is published as soon as the model writes it and the
+    analysis text follows into the record every `flush_interval` seconds.
+
+    `timeout` is a deadline on the whole job (cache lookup, retrieval, LLM), and
+    on a whole submit_batch, on top of the LLM client's own per-call timeout:
+    embedding and retrieval calls have none. Python can't cancel a stuck call,
+    so it keeps a spare thread until it returns, but the job is failed, its
+    worker moves on and calls that haven't started yet are cancelled.
+    """
+    IN_FLIGHT = ("pending", "running", "streaming")  # record "triage" states still owed an analysis
+
+    def __init__(self, triage_service, patient_mgr, max_workers=4, history=1000,
+                 stream=True, flush_interval=0.5, timeout=None):
+        self.triage_service = triage_service
+        self.patient_mgr = patient_mgr
+        self.max_workers = max_workers
+        self.history = history
+        self.stream = stream
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="triage")
+        # The analyses themselves; spare threads absorb calls stuck past their deadline
+        self._calls = ThreadPoolExecutor(max_workers=max_workers * 2, thread_name_prefix="triage-call")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # job_id -> status dict
+
+    def submit(self, name, age, complaint):
+        """Adds a pending patient and schedules its analysis. Returns the job id."""
+        patient = self.patient_mgr.add_patient(
+            name=name,
+            age=age,
+            complaint=complaint,
+            esi=None,
+            analysis="Triage in progress...",
+            triage="pending"
+        )
+        job_id = patient['id']
+        with self._lock:
+            self._jobs[job_id] = {"id": job_id, "status": "pending", "submitted": time.time()}
+            self._trim()
+
+        self._pool.submit(self._run, job_id, age, complaint)
+        return job_id
+
+    def resume(self, records):
+        """
+        Re-queues patients whose triage was cut off, e.g. restored from the journal
+        after a restart (jobs live in memory). Returns how many were queued.
+        """
+        records = [r for r in records if r.get('triage') in self.IN_FLIGHT]
+        now = time.time()
+        with self._lock:
+            for record in records:
+                self._jobs[record['id']] = {"id": record['id'], "status": "pending", "submitted": now, "resumed": True}
+            self._trim()
+        for record in records:
+            self.patient_mgr.update_patient(record['id'], triage="pending")
+            self._pool.submit(self._run, record['id'], record['age'], record['complaint'])
+        return len(records)
+
+    def _run(self, job_id, age, complaint):
+        self._set(job_id, status="running", started=time.time())
+        self.patient_mgr.update_patient(job_id, triage="running")
+
+        # Held while publishing stream progress, so nothing lands after a timeout is recorded
+        expired, guard = threading.Event(), threading.Lock()
+        status = "done"
         try:
-            response = self.chain.invoke({"query": f"Age: {age}. Complaint: {complaint}"})
-            result_text = response['result']
-            
-            # Extract ESI
-            match = re.search(r"ESI LEVEL:\s*(\d)", result_text)
-            esi = int(match.group(1)) if match else 5
-            
-            # Serialize docs for JSON response (get page content only)
-            docs = [doc.page_content[:200] + "..." for doc in response['source_documents']]
-            
-            return esi, result_text, docs
+            if self.stream:
+                call = self._calls.submit(self._run_streaming, job_id, age, complaint, expired, guard)
+            else:
+                call = self._calls.submit(self.triage_service.analyze, age, complaint)
+            esi, analysis, docs = call.result(timeout=self.timeout)
+            if analysis.startswith("Error:"):
+                status = "failed"
+        except FutureTimeoutError:
+            with guard:
+                expired.set()
+            call.cancel()  # Still queued behind stuck calls: don't spend retrieval and LLM quota on it
+            esi, analysis, docs, status = 5, f"Error: triage timed out after {self.timeout:g}s", [], "failed"
         except Exception as e:
-            return 5, f"Error: {e}", []
\ No newline at end of file
+            esi, analysis, docs, status = 5, f"Error: {e}", [], "failed"
+
+        self._finish(job_id, status, esi, analysis, docs)
+
+    def _run_streaming(self, job_id, age, complaint, expired, guard):
+        """Pushes the ESI to the queue on the first tokens, then the text as it streams."""
+        parts, last_flush = [], time.monotonic()
+        for event, value in self.triage_service.analyze_stream(age, complaint):
+            if event == "done":
+                return value
+            with guard:
+                if expired.is_set():
+                    return None  # Past the deadline; the job has already been failed
+                if event == "esi":
+                    self.patient_mgr.update_patient(job_id, esi=value, triage="streaming")
+                    self._set(job_id, esi=value)
+                elif event == "token":
+                    parts.append(value)
+                    if time.monotonic() - last_flush >= self.flush_interval:
+                        text = "".join(parts)
+                        self.patient_mgr.update_patient(job_id, analysis=text)
+                        self._set(job_id, analysis=text)
+                        last_flush = time.monotonic()
+        raise RuntimeError("Analysis stream ended without a result")
+
+    def submit_batch(self, patients, max_concurrency=8):
+        """
+        Adds every patient in one locked insert and triages them together in the background.
+        Returns (job_ids, results) where `results` is a Queue of per-patient updates
+        ending with None. Processing continues even if nobody reads the queue.
+        """
+        records = self.patient_mgr.add_patients([
+            dict(
+                name=p['name'],
+                age=p['age'],
+                complaint=p['complaint'],
+                esi=None,
+                analysis="Triage in progress...",
+                triage="pending"
+            )
+            for p in patients
+        ])
+        job_ids = [r['id'] for r in records]
+        now = time.time()
+        with self._lock:
+            for job_id in job_ids:
+                self._jobs[job_id] = {"id": job_id, "status": "pending", "submitted": now}
+            self._trim()
+
+        results = queue.Queue()
+        threading.Thread(
+            target=self._run_batch,
+            args=(job_ids, [(p['age'], p['complaint']) for p in patients], results, max_concurrency),
+            name="triage-batch",
+            daemon=True
+        ).start()
+        return job_ids, results
+
+    def _run_batch(self, job_ids, cases, results, max_concurrency):
+        started = time.time()
+        for job_id in job_ids:
+            self._set(job_id, status="running", started=started)
+            self.patient_mgr.update_patient(job_id, triage="running")
+
+        remaining = set(range(len(job_ids)))
+        expired, updates = threading.Event(), queue.Queue()
+        call = self._calls.submit(self._drain_batch, cases, max_concurrency, updates, expired)
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        error = "Error: batch ended without a result"
+        try:
+            while remaining:
+                try:
+                    item = updates.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    expired.set()
+                    call.cancel()
+                    error = f"Error: triage timed out after {self.timeout:g}s"
+                    break
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    error = f"Error: {item}"
+                    break
+                i, esi, analysis, docs = item
+                remaining.discard(i)
+                status = "failed" if analysis.startswith("Error:") else "done"
+                results.put(self._finish(job_ids[i], status, esi, analysis, docs, index=i))
+
+            for i in sorted(remaining):
+                results.put(self._finish(job_ids[i], "failed", 5, error, [], index=i))
+        finally:
+            results.put(None)
+
+    def _drain_batch(self, cases, max_concurrency, updates, expired):
+        """Hands analyze_batch results to _run_batch, ending with None (or the exception raised)."""
+        if expired.is_set():
+            return  # Started after the batch already timed out
+        batch = self.triage_service.analyze_batch(cases, max_concurrency)
+        try:
+            for item in batch:
+                if expired.is_set():
+                    return
+                updates.put(item)
+            updates.put(None)
+        except Exception as e:
+            updates.put(e)
+        finally:
+            batch.close()  # Cancels the LLM calls it hasn't started
+
+    def _finish(self, job_id, status, esi, analysis, docs, **extra):
+        if status == "failed":
+            # A failure never demotes an ESI that was already published (e.g. mid-stream)
+            record = self.patient_mgr.get(job_id)
+            if record and record.get('esi') is not None and record['esi'] < esi:
+                esi = record['esi']
+        self.patient_mgr.update_patient(job_id, esi=esi, analysis=analysis, source_docs=docs, triage=status)
+        self._set(job_id, status=status, finished=time.time(), esi=esi, analysis=analysis)
+        return {"id": job_id, "status": status, "esi": esi, **extra}
+
+    def _set(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def _trim(self):
+        # Forget the oldest finished jobs; the patient record itself stays in the queue
+        excess = len(self._jobs) - self.history
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id]["status"] in ("done", "failed"):
+                del self._jobs[job_id]
+                excess -= 1
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def stats(self):
+        with self._lock:
+            counts = {"pending": 0, "running": 0, "done": 0, "failed": 0}
+            for job in self._jobs.values():
+                counts[job["status"]] += 1
+        return {"workers": self.max_workers, **counts}
@@ -0,0 +1,49 @@
+# snapshots.py
+import hashlib
+import os
+import re
+import cv2
+
+NAME_PATTERN = re.compile(r"^[0-9a-f]{64}(_thumb)?\.jpg$")
+
+class SnapshotStore:
+    """
+    Content-addressed on-disk store for Code Black snapshots.
+    Each image is written once as <sha256>.jpg with a <sha256>_thumb.jpg beside it,
+    so patient records only need to carry a URL.
+    """
+    def __init__(self, root="./snapshots", thumb_width=320, quality=85):
+        self.root = os.path.abspath(root)
+        self.thumb_width = thumb_width
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        os.makedirs(self.root, exist_ok=True)
+
+    def save(self, frame):
+        """Encodes `frame`, stores it (and a thumbnail) if new, and returns its digest."""
+        flag, encoded = cv2.imencode(".jpg", frame, self.encode_params)
+        if not flag:
+            raise ValueError("Could not encode snapshot")
+        data = encoded.tobytes()
+        digest = hashlib.sha256(data).hexdigest()
+
+        full_path = os.path.join(self.root, f"{digest}.jpg")
+        if not os.path.exists(full_path):
+            h, w = frame.shape[:2]
+            scale = min(1.0, self.thumb_width / w)
+            thumb = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+            _, thumb_encoded = cv2.imencode(".jpg", thumb, self.encode_params)
+
+            # Thumbnail first: a full image on disk implies its thumbnail exists
+            self._write(os.path.join(self.root, f"{digest}_thumb.jpg"), thumb_encoded.tobytes())
+            self._write(full_path, data)
+        return digest
+
+    def _write(self, path, data):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def is_valid_name(name):
+        return bool(NAME_PATTERN.match(name))
@@ -1,5 +1,6 @@
 // Keep the same backend base URL
 const API = "http://localhost:5000/api";
+const SERVER = API.replace(/\/api$/, "");
 
 let currentStream = null;
 
@@ -9,7 +10,6 @@ document.addEventListener("DOMContentLoaded", () => {
   setupKiosk();
   setupNurse();
   setupVideo();
-  startQueuePolling();
 });
 
 // ============ TABS ============
@@ -28,9 +28,9 @@ function setupTabs() {
       const page = document.getElementById(`tab-${target}`);
       if (page) page.classList.add("active");
 
-      // Auto-refresh queue when opening nurse tab
+      // Catch up on changes when opening nurse tab
       if (target === "nurse") {
-        fetchQueue();
+        syncQueue();
       }
     });
   });
@@ -112,14 +112,19 @@ async function submitPatient() {
       throw new Error("Network error");
     }
 
-    const result = await res.json(); // expect { esi, analysis?, ... }
+    const job = await res.json(); // expect { status: "pending", job_id }
 
-    // Show triage result right away
-    updateKioskResult(result);
+    // Patient is already in the queue; the ESI follows once analysis finishes
     successCard.classList.remove("hidden");
 
     // Clear complaint text for next patient
     document.getElementById("complaint").value = "";
+
+    // Show the ESI as soon as it streams in, then the finished analysis
+    const result = await waitForTriage(job.job_id, (partial) => {
+      updateKioskResult({ esi: partial.esi, analysis: partial.analysis || "Analysis in progress..." });
+    });
+    updateKioskResult(result);
   } catch (err) {
     console.error(err);
     errorEl.classList.remove("hidden");
@@ -129,6 +134,20 @@ async function submitPatient() {
   }
 }
 
+// Poll the job status endpoint until the analysis lands
+async function waitForTriage(jobId, onPartial, intervalMs = 1000, maxWaitMs = 120000) {
+  const deadline = Date.now() + maxWaitMs;
+  while (Date.now() < deadline) {
+    const res = await fetch(`${API}/status/${jobId}`);
+    if (!res.ok) throw new Error("Network error");
+    const job = await res.json();
+    if (job.status === "done" || job.status === "failed") return job;
+    if (onPartial && typeof job.esi === "number") onPartial(job);
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+  throw new Error("Triage timed out");
+}
+
 function updateKioskResult(result) {
   const resultCard = document.getElementById("result");
   const badge = document.getElementById("esiBadge");
@@ -173,7 +192,7 @@ function setupNurse() {
       if (pinInput.value === PIN) {
         lock.classList.add("hidden");
         dash.classList.remove("hidden");
-        fetchQueue();
+        fetchQueue().then(startQueueStream);
       } else {
         pinInput.value = "";
         pinInput.placeholder = "Wrong PIN";
@@ -197,68 +216,149 @@ function setupNurse() {
   window.markDone = markDone;
 }
 
-async function fetchQueue() {
-  const list = document.getElementById("queueList");
-  const mCritical = document.getElementById("mCritical");
-  const mTotal = document.getElementById("mTotal");
-
-  if (!list) return;
-
-  list.innerHTML = "";
+// Client-side copy of the queue, patched from server deltas
+const queueState = {
+  version: 0,
+  patients: new Map(), // id -> record
+  nodes: new Map(), // id -> rendered .queueItem
+};
+let queueSource = null;
 
+// Full reload (Refresh button / unlock). Unchanged queues come back as a 304.
+async function fetchQueue() {
   try {
     const res = await fetch(`${API}/queue`);
     if (!res.ok) throw new Error("Network error");
     const patients = await res.json();
+    const version = Number(res.headers.get("X-Queue-Version")) || 0;
+    applyQueueDelta({ version, full: true, patients, removed: [] });
+  } catch (err) {
+    console.error(err);
+    showQueueError();
+  }
+}
 
-    if (!Array.isArray(patients) || patients.length === 0) {
-      list.innerHTML = `<div class="empty">No patients in queue.</div>`;
-      if (mCritical) mCritical.textContent = "0";
-      if (mTotal) mTotal.textContent = "0";
-      return;
-    }
+// Fetch only what changed since the version we already hold
+async function syncQueue() {
+  try {
+    const res = await fetch(`${API}/queue/delta?since=${queueState.version}`);
+    if (!res.ok) throw new Error("Network error");
+    applyQueueDelta(await res.json());
+  } catch (err) {
+    console.error(err);
+    showQueueError();
+  }
+}
 
-    // Metrics
-    const total = patients.length;
-    const critical = patients.filter((p) => p.esi === 1 || p.esi === 2).length;
-    if (mCritical) mCritical.textContent = critical;
-    if (mTotal) mTotal.textContent = total;
-
-    patients.forEach((p) => {
-      const item = document.createElement("div");
-      item.classList.add("queueItem", `esi${p.esi || "x"}`);
-
-      const status = p.status === "completed" ? "DONE" : "ACTIVE";
-      const badgeLabel = `ESI ${p.esi}`;
-      const time = p.time || "";
-
-      item.innerHTML = `
-        <div>
-          <div class="qTop">
-            <span class="badge">${badgeLabel}</span>
-            <span>${p.name || "Unknown"}</span>
-          </div>
-          <div class="qSub">
-            ${p.age ? `${p.age} yrs • ` : ""}${status}${time ? " • " + time : ""}
-          </div>
-        </div>
-        <div class="qRight">
-          ${p.complaint || ""}
-        </div>
-      `;
+function applyQueueDelta(delta) {
+  if (delta.full) queueState.patients.clear();
+  delta.patients.forEach((p) => queueState.patients.set(p.id, p));
+  delta.removed.forEach((id) => queueState.patients.delete(id));
+  queueState.version = delta.version;
 
-      item.addEventListener("click", () => {
-        showSelectedPatient(p);
-      });
+  const changed = delta.full ? null : [...delta.patients.map((p) => p.id), ...delta.removed];
+  renderQueue(changed);
+}
 
-      list.appendChild(item);
+// Same order as the server: active first, then ESI (pending = 2.5), then arrival
+function compareQueue(a, b) {
+  const done = (p) => (p.status === "completed" ? 1 : 0);
+  const rank = (p) => (p.esi === null ? 2.5 : p.esi);
+  return done(a) - done(b) || rank(a) - rank(b) || a.arrival - b.arrival;
+}
+
+// Rebuilds only the changed items, then moves misplaced nodes into order
+function renderQueue(changedIds) {
+  const list = document.getElementById("queueList");
+  const mCritical = document.getElementById("mCritical");
+  const mTotal = document.getElementById("mTotal");
+
+  if (!list) return;
+
+  if (changedIds === null) {
+    list.innerHTML = "";
+    queueState.nodes.clear();
+  } else {
+    changedIds.forEach((id) => {
+      const node = queueState.nodes.get(id);
+      if (node) node.remove();
+      queueState.nodes.delete(id);
     });
-  } catch (err) {
-    console.error(err);
-    list.innerHTML = `<div class="empty">Unable to load queue.</div>`;
+  }
+  list.querySelectorAll(".empty").forEach((el) => el.remove());
+
+  const patients = [...queueState.patients.values()].sort(compareQueue);
+
+  if (patients.length === 0) {
+    list.innerHTML = `<div class="empty">No patients in queue.</div>`;
     if (mCritical) mCritical.textContent = "0";
     if (mTotal) mTotal.textContent = "0";
+    return;
   }
+
+  // Metrics
+  const total = patients.length;
+  const critical = patients.filter((p) => p.esi === 1 || p.esi === 2).length;
+  if (mCritical) mCritical.textContent = critical;
+  if (mTotal) mTotal.textContent = total;
+
+  let cursor = list.firstChild;
+  patients.forEach((p) => {
+    let node = queueState.nodes.get(p.id);
+    if (!node) {
+      node = buildQueueItem(p);
+      queueState.nodes.set(p.id, node);
+    }
+    if (node === cursor) {
+      cursor = cursor.nextSibling;
+    } else {
+      list.insertBefore(node, cursor);
+    }
+  });
+}
+
+function buildQueueItem(p) {
+  const item = document.createElement("div");
+  item.classList.add("queueItem", `esi${p.esi || "x"}`);
+
+  const status = p.status === "completed" ? "DONE" : "ACTIVE";
+  const badgeLabel = p.esi === null ? "ESI …" : `ESI ${p.esi}`;
+  const time = p.time || "";
+  // Camera events: still in progress, or when the alert cleared
+  const event = p.alert_start ? (p.alert_end ? ` • cleared ${p.alert_end}` : " • ongoing") : "";
+
+  item.innerHTML = `
+    <div>
+      <div class="qTop">
+        <span class="badge">${badgeLabel}</span>
+        <span>${p.name || "Unknown"}</span>
+      </div>
+      <div class="qSub">
+        ${p.age ? `${p.age} yrs • ` : ""}${status}${time ? " • " + time : ""}${event}
+      </div>
+    </div>
+    <div class="qRight">
+      ${p.complaint || ""}
+    </div>
+  `;
+
+  item.addEventListener("click", () => {
+    showSelectedPatient(queueState.patients.get(p.id) || p);
+  });
+
+  return item;
+}
+
+function showQueueError() {
+  const list = document.getElementById("queueList");
+  const mCritical = document.getElementById("mCritical");
+  const mTotal = document.getElementById("mTotal");
+
+  if (list) list.innerHTML = `<div class="empty">Unable to load queue.</div>`;
+  queueState.nodes.clear();
+  queueState.version = 0;
+  if (mCritical) mCritical.textContent = "0";
+  if (mTotal) mTotal.textContent = "0";
 }
 
 function showSelectedPatient(p) {
@@ -300,6 +400,15 @@ function showSelectedPatient(p) {
       ${p.complaint || "—"}
     </div>
 
+    ${p.thumbnail ? `
+    <div class="divider"></div>
+
+    <div class="k">Snapshot</div>
+    <a href="${SERVER}${p.snapshot}" target="_blank" rel="noopener">
+      <img src="${SERVER}${p.thumbnail}" alt="Camera snapshot" class="snapshot" loading="lazy">
+    </a>
+    ` : ""}
+
     <div class="divider"></div>
 
     <div class="k">AI analysis</div>
@@ -318,7 +427,7 @@ function showSelectedPatient(p) {
   if (resolveBtn && p.id && p.status !== "completed") {
     resolveBtn.addEventListener("click", async () => {
       await markDone(p.id);
-      fetchQueue();
+      syncQueue();
       // After resolving, show generic text again
       card.innerHTML = `
         <div class="card-head">
@@ -342,15 +451,21 @@ async function markDone(id) {
   }
 }
 
-// Poll every 5 seconds if nurse tab is active and unlocked
-function startQueuePolling() {
-  setInterval(() => {
-    const nursePage = document.getElementById("tab-nurse");
-    const dash = document.getElementById("nurseDash");
-    if (nursePage && nursePage.classList.contains("active") && dash && !dash.classList.contains("hidden")) {
-      fetchQueue();
-    }
-  }, 5000);
+// Push queue changes over SSE; fall back to polling deltas every 5 seconds
+function startQueueStream() {
+  if (queueSource) return;
+
+  if (!window.EventSource) {
+    setInterval(() => {
+      const nursePage = document.getElementById("tab-nurse");
+      if (nursePage && nursePage.classList.contains("active")) syncQueue();
+    }, 5000);
+    return;
+  }
+
+  queueSource = new EventSource(`${API}/queue/stream?since=${queueState.version}`);
+  queueSource.onmessage = (event) => applyQueueDelta(JSON.parse(event.data));
+  queueSource.onerror = (err) => console.error(err); // EventSource reconnects by itself
 }
 
 // ============ VIDEO ============
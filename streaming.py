@@ -0,0 +1,62 @@
+# streaming.py
+import threading
+import cv2
+
+BOUNDARY = b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n'
+
+class FrameBroadcaster:
+    """
+    Encode-once, fan-out MJPEG source for a single camera.
+    The camera thread encodes each new frame exactly once; every connected viewer
+    streams the same bytes, so adding viewers doesn't add camera-side work.
+    """
+    def __init__(self, quality=80):
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self._cond = threading.Condition()
+        self.seq = 0        # Bumped on every published frame
+        self.chunk = None   # Latest multipart chunk (boundary + JPEG bytes)
+        self.viewers = 0
+        self.published = 0
+
+    def publish(self, frame):
+        """Encodes and shares a frame. Skipped entirely while nobody is watching."""
+        if self.viewers == 0:
+            return False
+
+        # Encode outside the lock so viewers are never blocked on it
+        flag, encoded = cv2.imencode(".jpg", frame, self.encode_params)
+        if not flag:
+            return False
+        chunk = BOUNDARY + encoded.tobytes() + b'\r\n'
+
+        with self._cond:
+            self.seq += 1
+            self.chunk = chunk
+            self.published += 1
+            self._cond.notify_all()
+        return True
+
+    def wait_for(self, last_seq, timeout=1.0):
+        """Blocks until a frame newer than `last_seq` exists. Returns (seq, chunk or None)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq != last_seq, timeout)
+            if self.seq == last_seq:
+                return last_seq, None
+            return self.seq, self.chunk
+
+    def stream(self):
+        """MJPEG generator for one viewer. Slow viewers simply skip to the newest frame."""
+        with self._cond:
+            self.viewers += 1
+        try:
+            seq = 0
+            while True:
+                seq, chunk = self.wait_for(seq)
+                if chunk is not None:
+                    yield chunk
+        finally:
+            with self._cond:
+                self.viewers -= 1
+
+    def stats(self):
+        return {"viewers": self.viewers, "published": self.published, "seq": self.seq}
@@ -0,0 +1,60 @@
+# stub_llm.py
+import re
+import time
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Keyword rules for the stub model, most urgent first
+STUB_ESI_RULES = (
+    (1, ("unresponsive", "not breathing", "cardiac arrest", "seizure", "anaphyla")),
+    (2, ("chest pain", "shortness of breath", "slurred", "confused", "worst", "overdose", "stroke")),
+    (3, ("abdominal", "vomiting", "fever", "fracture", "bleeding", "head injury")),
+    (4, ("sprain", "twisted", "ankle", "cut", "laceration", "sore throat", "rash")),
+)
+
+def _stub_esi(complaint):
+    text = complaint.lower()
+    for level, words in STUB_ESI_RULES:
+        if any(word in text for word in words):
+            return level
+    return 5
+
+class StubChatModel(BaseChatModel):
+    """
+    Deterministic stand-in for Gemini (LLM_BACKEND=stub), for benchmarks and
+    offline runs. Grades the complaint with keyword rules, answers in the
+    prompt's format and takes `latency` seconds, spread over the streamed
+    tokens so time-to-first-token behaves like a real model.
+    """
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "stub"
+
+    def _respond(self, messages):
+        prompt = messages[-1].content
+        complaint = prompt.split("PATIENT COMPLAINT:")[-1].split("TASK:")[0].strip()
+        context = prompt.split("CONTEXT:")[-1].split("PATIENT COMPLAINT:")[0].strip()
+        esi = _stub_esi(complaint)
+        return (
+            f"ESI LEVEL: {esi}\n\n"
+            f"Stub assessment of \"{complaint[:120]}\" against {len(context)} characters of handbook context. "
+            f"Keyword rules place this presentation at ESI {esi}.\n\n"
+            "Recommended actions: reassess vitals and escalate if the presentation changes."
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text = self._respond(messages)
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        pieces = re.findall(r"\S+\s*", self._respond(messages))
+        for piece in pieces:
+            time.sleep(self.latency / len(pieces))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
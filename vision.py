@@ -1,135 +1,428 @@
-import mediapipe as mp
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
 import cv2
-import math
+import time
+from collections import deque
 import numpy as np
 
-class VisionTriage:
+MODEL_PATH = 'pose_landmarker_lite.task'
+
+# Define connections for drawing the skeleton (Bone Map)
+CONNECTIONS = [
+    (11, 12), (11, 13), (13, 15), # Left Arm
+    (12, 14), (14, 16),           # Right Arm
+    (11, 23), (12, 24), (23, 24)  # Torso
+]
+
+# Landmark indices used by the rules (MediaPipe 33-point pose model)
+NOSE = 0
+L_SHLDR, R_SHLDR = 11, 12
+L_WRIST, R_WRIST = 15, 16
+L_HIP, R_HIP = 23, 24
+TORSO = [L_SHLDR, R_SHLDR, L_HIP, R_HIP]  # Centroid used to follow a person between frames
+
+# Per-pose feature columns. Distances are measured in shoulder widths.
+FEATURES = (
+    "l_neck", "r_neck",          # wrist -> neck (shoulder midpoint)
+    "l_chest", "r_chest",        # wrist -> chest centre
+    "l_head", "r_head",          # wrist -> nose
+    "head_drop",                 # nose.y - hip midpoint y (positive = head below hips)
+    "nose_velocity",             # nose.y - previous nose.y (NaN on the first frame)
+    "l_wrist_rise", "r_wrist_rise",  # shoulder.y - wrist.y (positive = wrist above shoulder)
+)
+
+# --- GESTURE RULES ---
+# Evaluated in priority order; the first rule that fires wins.
+# A rule fires if ANY of its clause groups holds, and a group holds if ALL of
+# its (feature, op, threshold) clauses hold.
+GESTURE_RULES = (
+    # 1. CHOKING (Both hands at neck)
+    ("CRITICAL: CHOKING DETECTED", (
+        (("l_neck", "<", 0.6), ("r_neck", "<", 0.6)),
+    )),
+    # 2. CHEST PAIN (Hand on center of chest)
+    ("URGENT: CHEST PAIN", (
+        (("l_chest", "<", 0.35),),
+        (("r_chest", "<", 0.45),),
+    )),
+    # 3. FALL (Head below hips or sudden downward movement)
+    ("CRITICAL: PATIENT DOWN", (
+        (("head_drop", ">", 0.0),),
+        (("nose_velocity", ">", 0.05),),
+    )),
+    # 4. HEADACHE (Hand on/near head)
+    ("MODERATE: HEADACHE", (
+        (("l_head", "<", 0.6), ("l_wrist_rise", ">", 0.0)),
+        (("r_head", "<", 0.6), ("r_wrist_rise", ">", 0.0)),
+    )),
+)
+
+def _compile_rules(rules):
+    """Flattens the rule table into arrays so every clause is checked in one comparison."""
+    cols, signs, thresholds = [], [], []
+    group_of_clause, rule_of_group = [], []
+    for rule_idx, (_, groups) in enumerate(rules):
+        for clauses in groups:
+            group_idx = len(rule_of_group)
+            rule_of_group.append(rule_idx)
+            for feature, op, threshold in clauses:
+                # "x > t" is rewritten as "-x < -t"
+                sign = 1.0 if op == "<" else -1.0
+                cols.append(FEATURES.index(feature))
+                signs.append(sign)
+                thresholds.append(sign * threshold)
+                group_of_clause.append(group_idx)
+
+    clause_groups = np.zeros((len(cols), len(rule_of_group)), dtype=np.float32)
+    clause_groups[np.arange(len(cols)), group_of_clause] = 1.0
+    group_rules = np.zeros((len(rule_of_group), len(rules)), dtype=np.float32)
+    group_rules[np.arange(len(rule_of_group)), rule_of_group] = 1.0
+
+    return {
+        "alerts": tuple(alert for alert, _ in rules),
+        "cols": np.array(cols, dtype=np.intp),
+        "signs": np.array(signs, dtype=np.float32),
+        "thresholds": np.array(thresholds, dtype=np.float32),
+        "clause_groups": clause_groups,
+        "group_sizes": clause_groups.sum(axis=0),
+        "group_rules": group_rules,
+    }
+
+_RULES = _compile_rules(GESTURE_RULES)
+ALERTS = _RULES["alerts"]
+
+def landmarks_to_array(landmarks):
+    """Converts MediaPipe landmark objects into a contiguous (33, 2) float32 array of (x, y)."""
+    return np.array([(lm.x, lm.y) for lm in landmarks], dtype=np.float32)
+
+def extract_features(poses, prev_nose_y=None):
+    """
+    Computes the FEATURES table for many poses in one vectorized pass.
+    poses: (N, 33, 2) float32. prev_nose_y: (N,) previous nose y, NaN where unknown.
+    Returns an (N, len(FEATURES)) float32 array.
+    """
+    poses = np.asarray(poses, dtype=np.float32)
+    n = poses.shape[0]
+    if prev_nose_y is None:
+        prev_nose_y = np.full(n, np.nan, dtype=np.float32)
+
+    l_shldr, r_shldr = poses[:, L_SHLDR], poses[:, R_SHLDR]
+    nose = poses[:, NOSE]
+
+    # --- DYNAMIC SCALE CALCULATION ---
+    # Shoulder width is the "ruler"; clamp it in case detection is glitchy
+    span = l_shldr - r_shldr
+    shoulder_width = np.maximum(np.sqrt((span * span).sum(axis=1)), 0.01)
+
+    # Anchors: neck (shoulder midpoint), chest (slightly below), nose
+    neck = (l_shldr + r_shldr) / 2
+    chest = neck.copy()
+    chest[:, 1] += 0.3 * shoulder_width
+    anchors = np.stack([neck, chest, nose], axis=1)        # (N, 3, 2)
+    wrists = poses[:, [L_WRIST, R_WRIST]]                   # (N, 2, 2)
+
+    # Every wrist -> anchor distance at once, as a ratio of shoulder width
+    diff = wrists[:, :, None, :] - anchors[:, None, :, :]
+    dists = np.sqrt((diff * diff).sum(axis=-1))
+    dists /= shoulder_width[:, None, None]                  # (N, wrist, anchor)
+
+    features = np.empty((n, len(FEATURES)), dtype=np.float32)
+    features[:, 0:6] = dists.transpose(0, 2, 1).reshape(n, 6)  # l/r pairs per anchor
+    features[:, 6] = nose[:, 1] - (poses[:, L_HIP, 1] + poses[:, R_HIP, 1]) / 2
+    features[:, 7] = nose[:, 1] - prev_nose_y
+    features[:, 8] = l_shldr[:, 1] - wrists[:, 0, 1]
+    features[:, 9] = r_shldr[:, 1] - wrists[:, 1, 1]
+    return features
+
+def evaluate_rules(features):
+    """
+    Applies GESTURE_RULES to an (N, F) feature array.
+    Returns an (N,) array of indices into ALERTS, -1 where nothing fired.
+    """
+    r = _RULES
+    # NaN features (e.g. no previous frame) compare False, so they never fire
+    clauses = (features[:, r["cols"]] * r["signs"]) < r["thresholds"]
+    groups = (clauses.astype(np.float32) @ r["clause_groups"]) == r["group_sizes"]
+    fired = (groups.astype(np.float32) @ r["group_rules"]) > 0
+    return np.where(fired.any(axis=1), fired.argmax(axis=1), -1)
+
+class PoseRules:
+    """
+    Gesture rules for a single camera.
+    Holds the per-camera state fall detection needs between frames, so the
+    detector itself can be shared (see inference.py).
+    """
     def __init__(self):
-        # 1. SETUP MODEL
-        base_options = python.BaseOptions(model_asset_path='pose_landmarker_lite.task')
+        # Fall detection: track previous nose position for sudden movement
+        self.prev_nose_y = None
+
+    def classify(self, landmarks):
+        """Returns the alert string for one (33, 2) pose array, or None."""
+        if not isinstance(landmarks, np.ndarray):
+            landmarks = landmarks_to_array(landmarks)
+
+        prev = np.nan if self.prev_nose_y is None else self.prev_nose_y
+        features = extract_features(landmarks[None], np.array([prev], dtype=np.float32))
+        self.prev_nose_y = float(landmarks[NOSE, 1])
+
+        idx = evaluate_rules(features)[0]
+        return ALERTS[idx] if idx >= 0 else None
+
+class PoseTracker:
+    """
+    Multi-person version of PoseRules.
+    Follows everyone in view with stable track IDs (greedy nearest torso
+    centroid), keeps each person's fall-detection state in flat arrays and
+    classifies the whole frame in one vectorized pass. A newcomer starts with
+    no previous nose position, so walking into frame can't read as a fall.
+    """
+    def __init__(self, max_distance=0.15, max_missing=10):
+        self.max_distance = max_distance  # Normalized units a torso may move between frames
+        self.max_missing = max_missing    # Frames a track survives without a match
+
+        self.ids = np.empty(0, dtype=np.int64)
+        self.centroids = np.empty((0, 2), dtype=np.float32)
+        self.prev_nose_y = np.empty(0, dtype=np.float32)
+        self.missing = np.empty(0, dtype=np.int32)
+        self._next_id = 0
+
+    def match(self, centroids):
+        """Assigns each centroid to a track index, closest pairs first. -1 = new person."""
+        assignment = np.full(len(centroids), -1, dtype=np.int64)
+        n_tracks = len(self.ids)
+        if len(centroids) == 0 or n_tracks == 0:
+            return assignment
+
+        diff = centroids[:, None, :] - self.centroids[None, :, :]
+        dist = np.sqrt((diff * diff).sum(axis=-1))             # (people, tracks)
+        candidates = np.flatnonzero(dist.ravel() <= self.max_distance)
+        taken = np.zeros(n_tracks, dtype=bool)
+        for flat in candidates[np.argsort(dist.ravel()[candidates], kind="stable")]:
+            person, track = divmod(int(flat), n_tracks)
+            if assignment[person] < 0 and not taken[track]:
+                assignment[person] = track
+                taken[track] = True
+        return assignment
+
+    def update(self, poses):
+        """
+        Matches a frame's (K, 33, 2) poses to tracks and classifies them.
+        Returns (track ids (K,), alert indices (K,) into ALERTS, -1 = none).
+        """
+        poses = np.asarray(poses, dtype=np.float32).reshape(-1, 33, 2)
+        centroids = poses[:, TORSO].mean(axis=1)
+        assignment = self.match(centroids)
+        matched = assignment >= 0
+        tracks = assignment[matched]
+
+        prev = np.full(len(poses), np.nan, dtype=np.float32)
+        prev[matched] = self.prev_nose_y[tracks]
+        alerts = evaluate_rules(extract_features(poses, prev))
+
+        # Refresh matched tracks, age the others, open tracks for newcomers
+        self.missing += 1
+        self.missing[tracks] = 0
+        self.centroids[tracks] = centroids[matched]
+        self.prev_nose_y[tracks] = poses[matched, NOSE, 1]
+
+        ids = np.empty(len(poses), dtype=np.int64)
+        ids[matched] = self.ids[tracks]
+        new = ~matched
+        ids[new] = np.arange(self._next_id, self._next_id + new.sum())
+        self._next_id += int(new.sum())
+
+        alive = self.missing <= self.max_missing
+        self.ids = np.concatenate([self.ids[alive], ids[new]])
+        self.centroids = np.concatenate([self.centroids[alive], centroids[new]])
+        self.prev_nose_y = np.concatenate([self.prev_nose_y[alive], poses[new, NOSE, 1]])
+        self.missing = np.concatenate([self.missing[alive], np.zeros(int(new.sum()), dtype=np.int32)])
+        return ids, alerts
+
+    def classify(self, poses):
+        """Returns (track ids, [alert string or None per pose])."""
+        ids, idx = self.update(poses)
+        return ids, [ALERTS[i] if i >= 0 else None for i in idx]
+
+def top_alert(alerts):
+    """The most urgent alert in a frame (rule order is priority order), or None."""
+    fired = [ALERTS.index(a) for a in alerts if a]
+    return ALERTS[min(fired)] if fired else None
+
+def draw_pose(frame, landmarks, alert):
+    """Draws the skeleton and alert banner onto `frame` in place and returns it."""
+    h, w, _ = frame.shape
+
+    # Convert normalized (0-1) to pixel coordinates in one go
+    pts = (np.asarray(landmarks, dtype=np.float32) * (w, h)).astype(np.int32)
+
+    # 1. Draw Bones (Lines)
+    for start_idx, end_idx in CONNECTIONS:
+        p1 = (int(pts[start_idx, 0]), int(pts[start_idx, 1]))
+        p2 = (int(pts[end_idx, 0]), int(pts[end_idx, 1]))
+        cv2.line(frame, p1, p2, (255, 255, 255), 2) # White bones
+
+    # 2. Draw Joints (Circles)
+    for idx in (L_SHLDR, R_SHLDR, L_WRIST, R_WRIST, NOSE, L_HIP):
+        cv2.circle(frame, (int(pts[idx, 0]), int(pts[idx, 1])), 6, (0, 255, 0), -1) # Green joints
+
+    # 3. Draw Alert Banner if needed
+    if alert:
+        _draw_banner(frame, alert)
+
+    return frame
+
+def _draw_banner(frame, alert):
+    color = (0, 0, 255) if "CRITICAL" in alert else (0, 165, 255)
+    cv2.rectangle(frame, (0, 0), (frame.shape[1], 60), color, -1)
+    cv2.putText(frame, alert, (20, 40), 
+               cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2, cv2.LINE_AA)
+
+def draw_poses(frame, poses, ids, alerts):
+    """Draws every tracked person with their ID, then one banner for the most urgent alert."""
+    h, w, _ = frame.shape
+    for pose, track_id in zip(poses, ids):
+        draw_pose(frame, pose, None)
+        x, y = int(pose[NOSE, 0] * w), int(pose[NOSE, 1] * h)
+        cv2.putText(frame, f"#{track_id}", (x + 10, y - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2, cv2.LINE_AA)
+
+    alert = top_alert(alerts)
+    if alert:
+        _draw_banner(frame, alert)
+    return frame
+
+class MotionGate:
+    """
+    Cheap motion detector that decides whether a frame is worth running pose on.
+    Compares a tiny grayscale copy of the frame against the last frame that was
+    actually analyzed, so slow movement still accumulates into a trigger.
+    """
+    def __init__(self, threshold=4.0, keepalive=2.0, size=(64, 48), window=5.0):
+        self.threshold = threshold  # Mean absolute pixel difference (0-255)
+        self.keepalive = keepalive  # Max seconds between inferences, even when idle
+        self.size = size
+        self.window = window        # Seconds used for the effective FPS figure
+
+        self.reference = None
+        self.last_run = None
+        self.score = 0.0
+        self.inferred = 0
+        self.skipped = 0
+        self._runs = deque()
+
+    def should_infer(self, frame, now=None, force=False):
+        """`force` analyzes the frame regardless of motion (it still becomes the new reference)."""
+        now = time.monotonic() if now is None else now
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        if self.reference is None:
+            self.score = float("inf")
+        else:
+            self.score = float(cv2.absdiff(small, self.reference).mean())
+
+        if not force and self.score < self.threshold and now - self.last_run < self.keepalive:
+            self.skipped += 1
+            return False
+
+        self.reference = small
+        self.last_run = now
+        self.inferred += 1
+        self._runs.append(now)
+        return True
+
+    def inference_fps(self, now=None):
+        now = time.monotonic() if now is None else now
+        while self._runs and now - self._runs[0] > self.window:
+            self._runs.popleft()
+        return len(self._runs) / self.window
+
+    def stats(self):
+        return {
+            "motion": round(self.score, 2) if self.reference is not None else None,
+            "inference_fps": round(self.inference_fps(), 2),
+            "inferred": self.inferred,
+            "skipped": self.skipped,
+        }
+
+class FramePrep:
+    """
+    Per-camera frame buffers, allocated once and reused for every frame.
+    Pose runs on a downscaled mirrored view (landmarks are normalized, so they
+    map straight back onto the display frame); the full-size mirrored frame is
+    only produced when something will actually be drawn on it.
+    """
+    def __init__(self, inference_width=None):
+        self.inference_width = inference_width  # None/0 = infer at full resolution
+        self._small = None
+        self._display = None
+
+    def _buffer(self, buf, shape, dtype):
+        return buf if buf is not None and buf.shape == shape else np.empty(shape, dtype=dtype)
+
+    def inference_view(self, frame):
+        """Mirrored (and downscaled) copy of `frame` for detection. Overwritten on the next call."""
+        h, w = frame.shape[:2]
+        if not self.inference_width or w <= self.inference_width:
+            self._small = self._buffer(self._small, frame.shape, frame.dtype)
+            return cv2.flip(frame, 1, dst=self._small)
+
+        size = (self.inference_width, max(1, round(h * self.inference_width / w)))
+        self._small = self._buffer(self._small, (size[1], size[0]) + frame.shape[2:], frame.dtype)
+        # INTER_AREA is ~10x slower at non-integer ratios; the detector resamples again anyway
+        cv2.resize(frame, size, dst=self._small, interpolation=cv2.INTER_LINEAR)
+        return cv2.flip(self._small, 1, dst=self._small)
+
+    def display_view(self, frame):
+        """Full-size mirrored copy of `frame` to draw on. Overwritten on the next call."""
+        self._display = self._buffer(self._display, frame.shape, frame.dtype)
+        return cv2.flip(frame, 1, dst=self._display)
+
+class VisionTriage:
+    def __init__(self, model_path=MODEL_PATH, num_poses=1, inference_width=None):
+        # 1. SETUP MODEL (mediapipe is imported here: only pose workers pay for it)
+        import mediapipe as mp
+        from mediapipe.tasks import python
+        from mediapipe.tasks.python import vision
+        self._mp = mp
+
+        base_options = python.BaseOptions(model_asset_path=model_path)
         options = vision.PoseLandmarkerOptions(
             base_options=base_options,
+            num_poses=num_poses,
             output_segmentation_masks=False,
             min_pose_detection_confidence=0.5,
             min_pose_presence_confidence=0.5,
             min_tracking_confidence=0.5
         )
         self.detector = vision.PoseLandmarker.create_from_options(options)
+        self.tracker = PoseTracker()
+        self.prep = FramePrep(inference_width)
 
-        # Fall detection: track previous nose position for sudden movement
-        self.prev_nose_y = None
-        self.fall_velocity_threshold = 0.05  # Sudden downward movement threshold
-
-        # Define connections for drawing the skeleton (Bone Map)
-        self.CONNECTIONS = [
-            (11, 12), (11, 13), (13, 15), # Left Arm
-            (12, 14), (14, 16),           # Right Arm
-            (11, 23), (12, 24), (23, 24)  # Torso
-        ]
+    def detect_all(self, frame):
+        """
+        Runs pose detection on an already mirrored frame.
+        Returns every detected pose as one (K, 33, 2) float32 array (K may be 0).
+        """
+        mp_image = self._mp.Image(image_format=self._mp.ImageFormat.SRGB, data=frame)
+        detection_result = self.detector.detect(mp_image)
+        poses = np.empty((len(detection_result.pose_landmarks), 33, 2), dtype=np.float32)
+        for i, landmarks in enumerate(detection_result.pose_landmarks):
+            poses[i] = landmarks_to_array(landmarks)
+        return poses
 
-    def _get_distance(self, p1, p2):
-        return math.sqrt((p1.x - p2.x)**2 + (p1.y - p2.y)**2)
+    def detect(self, frame):
+        """The first pose as a (33, 2) float32 array, or None if nobody is in view."""
+        poses = self.detect_all(frame)
+        return poses[0] if len(poses) else None
 
     def analyze_frame(self, frame):
+        """
+        Returns (annotated mirrored frame, most urgent alert). The frame is a
+        reused buffer, valid until the next call.
+        """
         # Flip frame for "mirror" effect (more natural interaction)
-        frame = cv2.flip(frame, 1)
-        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame)
-        
-        detection_result = self.detector.detect(mp_image)
-        alert = None
-        annotated_frame = frame.copy()
-        
-        if detection_result.pose_landmarks:
-            landmarks = detection_result.pose_landmarks[0]
-            h, w, _ = frame.shape
-
-            # Extract Key Landmarks
-            # 11-12: Shoulders, 13-14: Elbows, 15-16: Wrists, 23-24: Hips
-            l_shldr, r_shldr = landmarks[11], landmarks[12]
-            l_wrist, r_wrist = landmarks[15], landmarks[16]
-            nose = landmarks[0]
-            l_hip, r_hip = landmarks[23], landmarks[24]
-
-            # --- DYNAMIC SCALE CALCULATION ---
-            # We use shoulder width as our "ruler". 
-            # If the person is far away, this number is small. If close, it's big.
-            shoulder_width = self._get_distance(l_shldr, r_shldr)
-            
-            # Avoid division by zero if detection is glitchy
-            if shoulder_width < 0.01: shoulder_width = 0.01
-
-            # Calculate Neck Position (Midpoint of shoulders)
-            neck_x = (l_shldr.x + r_shldr.x) / 2
-            neck_y = (l_shldr.y + r_shldr.y) / 2
-            
-            # --- MEDICAL LOGIC (Ratio Based) ---
-            
-            # Calculate Chest Center (midpoint between shoulders, slightly below)
-            chest_x = (l_shldr.x + r_shldr.x) / 2
-            chest_y = (l_shldr.y + r_shldr.y) / 2 + (0.3 * shoulder_width)
-
-            # Calculate distances for detection
-            dist_l_neck = math.sqrt((l_wrist.x - neck_x)**2 + (l_wrist.y - neck_y)**2)
-            dist_r_neck = math.sqrt((r_wrist.x - neck_x)**2 + (r_wrist.y - neck_y)**2)
-            dist_l_chest = math.sqrt((l_wrist.x - chest_x)**2 + (l_wrist.y - chest_y)**2)
-            dist_r_chest = math.sqrt((r_wrist.x - chest_x)**2 + (r_wrist.y - chest_y)**2)
-            dist_l_head = self._get_distance(l_wrist, nose)
-            dist_r_head = self._get_distance(r_wrist, nose)
-
-            # Fall detection calculations
-            hip_mid_y = (l_hip.y + r_hip.y) / 2
-
-            # Detect sudden downward movement
-            sudden_fall = False
-            if self.prev_nose_y is not None:
-                nose_velocity = nose.y - self.prev_nose_y  # Positive = moving down
-                if nose_velocity > self.fall_velocity_threshold:
-                    sudden_fall = True
-            self.prev_nose_y = nose.y
-
-            is_down = nose.y > hip_mid_y  # Head below hips
-
-            # 1. CHOKING (Both hands at neck)
-            if dist_l_neck < (0.6 * shoulder_width) and dist_r_neck < (0.6 * shoulder_width):
-                 alert = "CRITICAL: CHOKING DETECTED"
-
-            # 2. CHEST PAIN (Hand on center of chest)
-            elif dist_l_chest < (0.35 * shoulder_width) or dist_r_chest < (0.45 * shoulder_width):
-                 alert = "URGENT: CHEST PAIN"
-
-            # 3. FALL (Head below hips or sudden downward movement)
-            elif is_down or sudden_fall:
-                 alert = "CRITICAL: PATIENT DOWN"
-
-            # 4. HEADACHE (Hand on/near head)
-            elif (dist_l_head < (0.6 * shoulder_width) and l_wrist.y < l_shldr.y) or \
-                 (dist_r_head < (0.6 * shoulder_width) and r_wrist.y < r_shldr.y):
-                 alert = "MODERATE: HEADACHE"
-
-            # --- DRAWING THE SKELETON ---
-            # 1. Draw Bones (Lines)
-            for start_idx, end_idx in self.CONNECTIONS:
-                start_point = landmarks[start_idx]
-                end_point = landmarks[end_idx]
-                
-                # Convert normalized (0-1) to pixel coordinates
-                p1 = (int(start_point.x * w), int(start_point.y * h))
-                p2 = (int(end_point.x * w), int(end_point.y * h))
-                
-                cv2.line(annotated_frame, p1, p2, (255, 255, 255), 2) # White bones
-
-            # 2. Draw Joints (Circles)
-            for lm in [l_shldr, r_shldr, l_wrist, r_wrist, nose, l_hip]:
-                cx, cy = int(lm.x * w), int(lm.y * h)
-                cv2.circle(annotated_frame, (cx, cy), 6, (0, 255, 0), -1) # Green joints
-
-            # 3. Draw Alert Banner if needed
-            if alert:
-                color = (0, 0, 255) if "CRITICAL" in alert else (0, 165, 255)
-                cv2.rectangle(annotated_frame, (0, 0), (w, 60), color, -1)
-                cv2.putText(annotated_frame, alert, (20, 40), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2, cv2.LINE_AA)
-
-        return annotated_frame, alert
\ No newline at end of file
+        poses = self.detect_all(self.prep.inference_view(frame))
+        annotated_frame = self.prep.display_view(frame)
+
+        ids, alerts = self.tracker.classify(poses)
+        draw_poses(annotated_frame, poses, ids, alerts)
+        return annotated_frame, top_alert(alerts)